@@ -40,8 +40,8 @@ class AstMap:
             key = ins_node.astNode.id
         value = AstSymbol(std_node.astNode.id, std_node)
         if self.symbol_table.has(key):
-            new_list = self.symbol_table.get(key)
-            new_list.append(value)
+            # The list may be shared with the map this one was layered on, so it is copied rather than appended to
+            new_list = self.symbol_table.get(key) + [value]
             if not (key in self.conflict_keys):
                 for other in new_list:
                     if value.id != other.id:
@@ -82,18 +82,50 @@ class AstMap:
         """
         return len(self.conflict_keys) > 0
 
+    def get_bindings_key(self, settled=()):
+        """
+        :param settled: the names of symbols and expressions whose bindings are left out of the record
+        :return: a hashable record of the student nodes that each symbol and expression is bound to, which is the same
+                 for mappings that only differ in how the unnamed parts of the pattern were paired
+        """
+        symbols = tuple(sorted((key, tuple(symbol.astNode.tree_id for symbol in value))
+                               for key, value in self.symbol_table.iter_items() if key not in settled))
+        expressions = tuple(sorted((key, value.tree_id) for key, value in self.exp_table.iter_items()
+                                   if key not in settled))
+        return symbols, expressions
+
     def new_merged_map(self, other):
         """
         Returns a newly merged map consisting of this and other
-        without modifying self.
+        without modifying self. The new map is layered on top of this one's tables rather than copying them, so only
+        the contents of other have to be added; this map must not be modified afterwards.
         :param other: (type AstMap) the other AstMap to be merged with
         :return: self modified by adding the contents of other
         """
         new_map = AstMap()
-        new_map.merge_map_with(self)
+        new_map.mappings = CtMap(self.mappings)
+        new_map.symbol_table = CtMap(self.symbol_table)
+        new_map.exp_table = CtMap(self.exp_table)
+        new_map.conflict_keys = list(self.conflict_keys)
         new_map.merge_map_with(other)
         return new_map
 
+    def copy(self):
+        """
+        Returns a copy of this map that can be modified without changing this one. The node pairings and expressions
+        are layered on top of this map's tables rather than copied, so this map must not be modified afterwards.
+        :return: the new AstMap
+        """
+        new_map = AstMap()
+        new_map.mappings = CtMap(self.mappings)
+        for key, value in self.symbol_table.iter_items():
+            new_map.symbol_table.set(key, list(value))
+        new_map.exp_table = CtMap(self.exp_table)
+        new_map.conflict_keys = list(self.conflict_keys)
+        new_map.match_root = self.match_root
+        new_map.match_lineno = self.match_lineno
+        return new_map
+
     def merge_map_with(self, other):
         """
         Returns a newly merged map consisting of this and other
@@ -104,16 +136,13 @@ class AstMap:
         if type(other) != type(self):
             raise TypeError
         # merge all mappings
-        other_map = other.mappings
-        for other_map_key, other_map_value in zip(other_map.keys, other_map.values):
+        for other_map_key, other_map_value in other.mappings.iter_items():
             self.mappings.set(other_map_key, other_map_value)
         # merge all expressions
-        other_exp = other.exp_table
-        for other_expKey, other_expValue in zip(other_exp.keys, other_exp.values):
+        for other_expKey, other_expValue in other.exp_table.iter_items():
             self.exp_table.set(other_expKey, other_expValue)
         # merge all symbols
-        other_sym = other.symbol_table
-        for key, value in zip(other_sym.keys, other_sym.values):
+        for key, value in other.symbol_table.iter_items():
             for sub_value in value:
                 self.add_var_to_sym_table(key, sub_value.astNode)
 
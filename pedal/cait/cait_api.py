@@ -1,31 +1,107 @@
 from pedal.report import Report, MAIN_REPORT
 from pedal.source import set_source
+from pedal.source.source_cache import SOURCE_CACHE
 from pedal.tifa import tifa_analysis
+from pedal.tifa.tifa import Tifa
 from pedal.cait.stretchy_tree_matching import *
+from pedal.cait.pattern_cache import PATTERN_CACHE
+from pedal.cait.multi_pattern_matcher import MultiPatternMatcher
+from pedal.cait.incremental import IncrementalMatcher
+from pedal.cait.matcher_profile import MatcherProfile
 
 
 class Cait:
-    def __init__(self, std_code=None, report=None):
+    def __init__(self, std_code=None, report=None, analyze=True):
+        """
+        :param std_code: student code to analyze in a new report, instead of the code of an existing report
+        :param report: the report whose code should be analyzed, defaulting to MAIN_REPORT
+        :param analyze: whether TIFA should analyze the code (and attach its feedback to the report) if it has not yet
+        """
         if report is None and std_code is None:
             self.report = MAIN_REPORT
         elif report is not None and std_code is not None:
             raise Exception("New code should generate new reports")
         elif std_code is not None:
             self.report = Report()
-            set_source(std_code, self.report)
+            set_source(std_code, report=self.report)
+        else:
+            self.report = report
 
-        if 'cait' not in self.report:
+        if 'cait' not in self.report or self._is_stale():
             self._initialize_report()
+        if analyze and self.report['source'].get('success') and not self.report['cait'].get('analyzed'):
+            tifa_analysis(report=self.report)
+            self.report['cait']['analyzed'] = True
+
+    def _is_stale(self):
+        """
+        Determines whether the source code was replaced (e.g., by calling set_source again) after the report's cait
+        namespace was built, in which case the student AST and any cached matches no longer apply. This includes
+        code that failed to parse, which leaves no AST to compare against.
+        """
+        cait = self.report['cait']
+        source = self.report['source']
+        return (cait.get('source_code') != source.get('code') or
+                cait.get('source_success') != source.get('success'))
 
     def _initialize_report(self):
         """
-        Initialize a successful report with possible set of issues.
+        Initialize a successful report with possible set of issues. If the source code could not be parsed, the
+        student AST is an empty module, so that nothing is matched.
         """
-        if self.report["source"]["success"]:
-            std_ast = self.report['source']['ast']
-            self.report['cait'] = {}
-            self.report['cait']['std_ast'] = EasyNode(std_ast)
-            tifa_analysis(report=self.report)
+        source = self.report['source']
+        previous = self.report['cait'] if 'cait' in self.report else {}
+        self.report['cait'] = {'source_code': source.get('code'), 'source_success': source.get('success')}
+        # The analysis of the previous submission is kept for use_incremental_matching
+        if 'on_change' in previous:
+            self.report['cait']['on_change'] = previous['on_change']
+        if source.get('success'):
+            self.report['cait']['std_ast'] = _get_easy_node(source['code'], source['ast'])
+        else:
+            self.report['cait']['std_ast'] = EasyNode(ast.parse(''))
+
+
+def _attach_variable_types(report, matchers):
+    """Builds the table that type-constrained pattern variables (e.g., _items__list_) are checked against, if any of
+    matchers needs it and it has not been built yet. It maps each top-level variable's name to its TIFA type, and is
+    kept on the root of the student's tree so that the matcher can find it from any student node.
+
+    :param report: the report whose student code is about to be searched
+    :param matchers: the StretchyTreeMatchers that the search will use
+    """
+    std_ast = report['cait']['std_ast']
+    if std_ast.variable_types is not None or not any(matcher.is_type_constrained() for matcher in matchers):
+        return
+    if 'tifa' not in report:
+        tifa_analysis(report=report)
+    top_level_variables = report['tifa'].get('top_level_variables', {})
+    std_ast.variable_types = {name: state.type for name, state in top_level_variables.items()}
+
+
+def _attach_tree_variable_types(std_root):
+    """Builds the table that type-constrained pattern variables are checked against for a student tree that is not
+    the report's, from a TIFA analysis of that tree alone
+
+    :param std_root: the root of the student tree
+    """
+    if std_root.variable_types is None:
+        top_level_variables = Tifa(report=Report()).process_ast(std_root.astNode)['top_level_variables']
+        std_root.variable_types = {name: state.type for name, state in top_level_variables.items()}
+
+
+def _get_easy_node(code, std_ast):
+    """Wraps std_ast in an EasyNode, reusing the one built for any earlier report on the same code
+
+    :param code: the student code that std_ast was parsed from
+    :param std_ast: the student AST
+    :return: the EasyNode for std_ast
+    """
+    entry = SOURCE_CACHE.get(code)
+    if entry.get('ast') is not std_ast:
+        return EasyNode(std_ast)
+    if 'easy_node' not in entry:
+        entry['easy_node'] = EasyNode(std_ast)
+    return entry['easy_node']
 
 
 # noinspection PyBroadException
@@ -34,19 +110,12 @@ def parse_program():
 
     :return: student AST
     """
-    try:
-        std_easy = MAIN_REPORT['cait']['std_ast']
-    except KeyError:
-        if MAIN_REPORT["source"]["success"]:
-            std_ast = MAIN_REPORT['source']['ast']
-            MAIN_REPORT['cait']['matcher'] = None
-        else:
-            MAIN_REPORT.attach("No source code found", tool='cait', 
-                               category='analyzer')
-            std_ast = ast.parse('')
-        MAIN_REPORT['cait']['std_ast'] = EasyNode(std_ast)
-        std_easy = MAIN_REPORT['cait']['std_ast']
-    return std_easy
+    report = Cait(analyze=False).report
+    if not report['source'].get('success') and 'no_source_reported' not in report['cait']:
+        report.attach("No source code found", tool='cait',
+                      category='analyzer')
+        report['cait']['no_source_reported'] = True
+    return report['cait']['std_ast']
 
 
 def def_use_error(node, report=None):
@@ -107,11 +176,25 @@ def find_match(ins_code, std_code=None, report=None, cut=False):
     :param cut: set to true to trim root to first branch
     :return: First match of tree inclusion of instructor in student or None
     """
-    matches = find_matches(ins_code=ins_code, std_code=std_code, report=report, cut=cut)
-    if matches:
-        return matches[0]
-    else:
-        return None
+    cait_obj = Cait(std_code=std_code, report=report)
+    std_code = cait_obj.report['cait']['std_ast']
+    matcher = PATTERN_CACHE.get(ins_code, cut=cut)
+    cait_obj.report['cait']['matcher'] = matcher
+    match_cache = _get_match_cache(cait_obj.report)
+    key = (matcher, std_code, cut)
+    if key in match_cache:
+        matches = match_cache[key]
+        return matches[0].copy() if matches else None
+    if 'incremental' in cait_obj.report['cait']:
+        matches = find_matches(ins_code, report=cait_obj.report, cut=cut)
+        return matches[0] if matches else None
+    # Only the search up to the first match is done, so it is cached apart from the complete results
+    first_key = key + ('first',)
+    if first_key not in match_cache:
+        match_cache[first_key] = _track_mappings(cait_obj.report, [matcher],
+                                                 lambda: next(matcher.iter_matches(std_code, cut=cut), None))
+    match = match_cache[first_key]
+    return match.copy() if match is not None else None
 
 
 def find_matches(ins_code, std_code=None, report=None, cut=False):
@@ -125,9 +208,132 @@ def find_matches(ins_code, std_code=None, report=None, cut=False):
     """
     cait_obj = Cait(std_code=std_code, report=report)
     std_code = cait_obj.report['cait']['std_ast']
-    matcher = StretchyTreeMatcher(ins_code)
+    matcher = PATTERN_CACHE.get(ins_code, cut=cut)
     cait_obj.report['cait']['matcher'] = matcher
-    matches = cait_obj.report['cait']['matcher'].find_matches(std_code, cut=cut)
+    match_cache = _get_match_cache(cait_obj.report)
+    key = (matcher, std_code, cut)
+    if key not in match_cache:
+        incremental = cait_obj.report['cait'].get('incremental')
+        if incremental is not None:
+            match_cache[key] = _track_mappings(cait_obj.report, [matcher],
+                                               lambda: incremental.find_matches(matcher, std_code, cut=cut))
+        else:
+            match_cache[key] = _track_mappings(cait_obj.report, [matcher],
+                                               lambda: matcher.find_matches(std_code, cut=cut))
+    return _copy_matches(match_cache[key])
+
+
+def find_matches_many(ins_codes, std_code=None, report=None, cut=False):
+    """Apply Tree Inclusion for several patterns, walking the student code only once
+
+    :param ins_codes: a list of instructor patterns
+    :param std_code: Student Code
+    :param report: the report to use for finding matches
+    :param cut: set to true to trim roots to first branch
+    :return: a list holding, for each pattern, the same result that find_matches would return for it
+    """
+    cait_obj = Cait(std_code=std_code, report=report)
+    std_code = cait_obj.report['cait']['std_ast']
+    match_cache = _get_match_cache(cait_obj.report)
+    matchers = [PATTERN_CACHE.get(ins_code, cut=cut) for ins_code in ins_codes]
+    if 'incremental' in cait_obj.report['cait']:
+        return [find_matches(ins_code, report=cait_obj.report, cut=cut) for ins_code in ins_codes]
+    missing = []
+    for matcher in matchers:
+        if (matcher, std_code, cut) not in match_cache and matcher not in missing:
+            missing.append(matcher)
+    if missing:
+        results = _track_mappings(cait_obj.report, missing,
+                                  lambda: MultiPatternMatcher(missing).find_matches(std_code, cut=cut))
+        for matcher, matches in zip(missing, results):
+            match_cache[(matcher, std_code, cut)] = matches
+    all_matches = []
+    for matcher in matchers:
+        all_matches.append(_copy_matches(match_cache[(matcher, std_code, cut)]))
+    return all_matches
+
+
+def use_incremental_matching(incremental=None, report=None):
+    """Makes the matches for this report reuse those of the previous submission analyzed by incremental, wherever
+    a top-level statement is unchanged. Meant for feedback that is given while the student types.
+
+    :param incremental: the IncrementalMatcher that remembers the previous submission, defaulting to the one kept in
+                        the report's cait namespace
+    :param report: the report whose matches should be found incrementally
+    """
+    cait_obj = Cait(report=report)
+    if 'std_ast' not in cait_obj.report['cait']:
+        return
+    if incremental is None:
+        if 'on_change' not in cait_obj.report['cait']:
+            cait_obj.report['cait']['on_change'] = IncrementalMatcher()
+        incremental = cait_obj.report['cait']['on_change']
+    incremental.start(cait_obj.report['cait']['std_ast'])
+    cait_obj.report['cait']['incremental'] = incremental
+
+
+def profile_matching(report=None):
+    """Starts profiling every pattern matched for this report, so that slow patterns can be found
+
+    The profile can be exported with its to_json and to_folded methods.
+    :param report: the report to profile the matching of
+    :return: the MatcherProfile that the report's searches are recorded in
+    """
+    cait_obj = Cait(report=report)
+    if 'profile' not in cait_obj.report['cait']:
+        cait_obj.report['cait']['profile'] = MatcherProfile()
+    return cait_obj.report['cait']['profile']
+
+
+def _track_mappings(report, matchers, search):
+    """Runs a search, recording how much mapping work it took in the report's cait namespace
+
+    'mapping_count' accumulates the candidate mappings that were generated, and 'mappings_truncated' becomes True if
+    any merge step had to drop candidates for reaching the matcher's max_mappings. If profile_matching was called for
+    the report, the search is also profiled.
+    :param report: the report the search is being done for
+    :param matchers: the StretchyTreeMatchers used by the search
+    :param search: a function that performs the search
+    :return: the result of search
+    """
+    _attach_variable_types(report, matchers)
+    mapping_count = sum(matcher.mapping_count for matcher in matchers)
+    truncation_count = sum(matcher.truncation_count for matcher in matchers)
+    if 'profile' in report['cait']:
+        result = report['cait']['profile'].run(matchers, search)
+    else:
+        result = search()
+    mapping_count = sum(matcher.mapping_count for matcher in matchers) - mapping_count
+    truncation_count = sum(matcher.truncation_count for matcher in matchers) - truncation_count
+    report['cait']['mapping_count'] = report['cait'].get('mapping_count', 0) + mapping_count
+    if truncation_count:
+        report['cait']['mappings_truncated'] = True
+    return result
+
+
+def _get_match_cache(report):
+    """Retrieves the match results already computed for this report
+
+    The cache lives in the report's cait namespace, so it is dropped along with the student AST whenever set_source
+    replaces the code. The cached AstMaps are never handed out themselves, only copies of them (see _copy_matches).
+    :param report: the report whose match cache should be retrieved
+    :return: a dictionary mapping (matcher, student EasyNode, cut) to the results of that search, and
+             (matcher, student EasyNode, cut, 'first') to the first match alone
+    """
+    if 'match_cache' not in report['cait']:
+        report['cait']['match_cache'] = {}
+    return report['cait']['match_cache']
+
+
+def _copy_matches(matches):
+    """Copies cached match results, so that callers can modify the matches they are given without changing the
+    results that later searches are answered with
+
+    :param matches: a list of AstMaps, or False if there were no matches
+    :return: a new list of copies of the AstMaps, or False
+    """
+    if matches:
+        return [match.copy() for match in matches]
     return matches
 
 
@@ -144,14 +350,35 @@ def find_expr_sub_matches(ins_expr, std_expr, as_expr=True, is_mod=False, cut=Fa
     """
     if not isinstance(ins_expr, str):
         raise TypeError("ins_expr expected str, found {0}".format(type(ins_expr)))
-    matcher = StretchyTreeMatcher(ins_expr)
-    if not is_mod and len(matcher.rootNode.children) != 1:
-        raise ValueError("ins_expr does not evaluate to a singular statement")
-    else:
-        if not is_mod:
-            new_root = matcher.rootNode.children[0]
-            if as_expr and new_root.ast_name != "Expr":
-                raise ValueError("ins_expr does not evaluate to an Expr node or singular statement")
-            else:
-                matcher.rootNode = new_root
-    return matcher.find_matches(std_expr, check_meta=False, cut=cut)
+    matcher = PATTERN_CACHE.get_sub(ins_expr, as_expr=as_expr, is_mod=is_mod)
+    if (not isinstance(std_expr, EasyNode) or 'cait' not in MAIN_REPORT or
+            MAIN_REPORT['cait'].get('std_ast') is not std_expr.linear_tree[0]):
+        std_expr = StretchyTreeMatcher.as_easy_node(std_expr)
+        if matcher.is_type_constrained():
+            _attach_tree_variable_types(std_expr.linear_tree[0])
+        return matcher.find_matches(std_expr, check_meta=False, cut=cut)
+    # std_expr is part of the report's student tree, so the search only covers its interval of that tree and the
+    # results are cached with the report's other matches
+    match_cache = _get_match_cache(MAIN_REPORT)
+    key = (matcher, std_expr, cut)
+    if key not in match_cache:
+        match_cache[key] = _track_mappings(MAIN_REPORT, [matcher],
+                                           lambda: matcher.find_matches(std_expr, check_meta=False, cut=cut))
+    return _copy_matches(match_cache[key])
+
+
+def find_sub_matches(match, exp_name, ins_expr, as_expr=True, is_mod=False, cut=False):
+    """Finds ins_expr within the student subtree that an earlier match bound to one of its expression variables
+
+    :param match: a match of an outer pattern
+    :param exp_name: the outer pattern's expression variable (e.g., "__expr__") whose subtree should be searched
+    :param ins_expr: the expression to find (str that MUST evaluate to a Module node with a single child)
+    :param as_expr: whether it's an expression match or not, experimental
+    :param is_mod: currently hack for multiline sub matches
+    :param cut: flag for cutting off root until a branch occurs
+    :return: a list of matches or False if no matches found, including if exp_name was not bound
+    """
+    std_expr = match.get_exp_name(exp_name)
+    if std_expr is None:
+        return False
+    return find_expr_sub_matches(ins_expr, std_expr, as_expr=as_expr, is_mod=is_mod, cut=cut)
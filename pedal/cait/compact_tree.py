@@ -0,0 +1,113 @@
+import ast
+from array import array
+from bisect import bisect_left
+
+# Every kind of ast node has a small integer code, shared by all trees, so that instructor and student nodes can be
+# compared by code. The node classes of the ast module are numbered in order of their names, so that every process
+# with the same grammar (see pedal.cait.pattern_bundle) gives them the same codes; any other class is numbered when it
+# is first seen.
+TYPE_NAMES = sorted(name for name, value in vars(ast).items()
+                    if isinstance(value, type) and issubclass(value, ast.AST))
+TYPE_CODES = {getattr(ast, name): code for code, name in enumerate(TYPE_NAMES)}
+
+
+def get_type_code(node_class):
+    """
+    :param node_class: the class of an ast node
+    :return: the integer code of node_class
+    """
+    code = TYPE_CODES.get(node_class)
+    if code is None:
+        code = TYPE_CODES[node_class] = len(TYPE_NAMES)
+        TYPE_NAMES.append(node_class.__name__)
+    return code
+
+
+class CompactTree:
+    """
+    The shape of a tree of EasyNodes, kept in parallel integer arrays indexed by tree_id rather than on each node. Nodes
+    are numbered in preorder, so the subtree of a node occupies the tree_ids from its own up to its subtree_end. The
+    matcher walks and prunes student trees by reading these arrays, and only looks at the EasyNodes of the subtrees
+    that it actually tries to match.
+
+    :self.type_codes: the type code (see get_type_code) of each node
+    :self.parents: the tree_id of each node's parent, or -1 for the root
+    :self.subtree_ends: the tree_id just past the end of each node's subtree
+    :self.heights: the height of each node's subtree
+    :self.type_index: a dictionary mapping each node type name to the sorted tree_ids of the nodes of that type
+    :self.name_index: a dictionary mapping each variable name to the sorted tree_ids of the Name nodes with that id
+    """
+
+    def __init__(self):
+        self.type_codes = array('H')
+        self.parents = array('i')
+        self.subtree_ends = array('i')
+        self.heights = array('i')
+        self.type_index = {}
+        self.name_index = {}
+
+    def __len__(self):
+        return len(self.type_codes)
+
+    def add(self, node_class, parent_id):
+        """Numbers the next node in preorder. Its subtree is unknown until close is called.
+
+        :param node_class: the class of the node's ast node
+        :param parent_id: the tree_id of the node's parent, or -1 for the root
+        :return: the tree_id of the node
+        """
+        tree_id = len(self.type_codes)
+        self.type_codes.append(get_type_code(node_class))
+        self.parents.append(parent_id)
+        self.subtree_ends.append(tree_id + 1)
+        self.heights.append(1)
+        return tree_id
+
+    def close(self, tree_id, child_ids):
+        """Records the extent and height of a node's subtree, once all of its descendants have been added
+
+        :param tree_id: the tree_id of the node
+        :param child_ids: the tree_ids of the node's children
+        """
+        self.subtree_ends[tree_id] = len(self.type_codes)
+        self.heights[tree_id] = 1 + max([self.heights[child_id] for child_id in child_ids] or [0])
+
+    def subtree_range(self, index, key, tree_id):
+        """Finds the entries of an index that fall within a node's subtree
+
+        :param index: either the type_index or name_index of the tree
+        :param key: the type or name being looked up
+        :param tree_id: the root of the subtree
+        :return: a tuple of the start and end of the entries within the subtree, and the list of entries itself
+        """
+        tree_ids = index.get(key, [])
+        start = bisect_left(tree_ids, tree_id)
+        end = bisect_left(tree_ids, self.subtree_ends[tree_id], start)
+        return start, end, tree_ids
+
+    def count_all(self, tree_id, node_type):
+        """
+        :param tree_id: the root of the subtree
+        :param node_type: the name of a node type
+        :return: the number of nodes of that type in the subtree
+        """
+        start, end, tree_ids = self.subtree_range(self.type_index, node_type, tree_id)
+        return end - start
+
+    def has_name(self, tree_id, name_id):
+        """
+        :param tree_id: the root of the subtree
+        :param name_id: the id of a variable
+        :return: True if a Name node with the given id is found in the subtree
+        """
+        start, end, tree_ids = self.subtree_range(self.name_index, name_id, tree_id)
+        return end > start
+
+    def fits(self, tree_id, size, height):
+        """
+        :param tree_id: the root of the subtree
+        :param size: the number of nodes the subtree must have at least
+        :param height: the height the subtree must have at least
+        :return: whether the subtree is that large
+        """
+        return self.subtree_ends[tree_id] - tree_id >= size and self.heights[tree_id] >= height
@@ -1,98 +1,141 @@
 class CtMap:
     """
-    A cache implemented map using linear lists. This is a hold over from the javascript library when we couldn't be sure
-    that a student's javascript could use maps.
+    A map backed by a dictionary that remembers the order in which keys were first set.
 
-    The design pattern used in this map is to always used the cached key/associated index. So methods accessing values
-    will first call update_cache, and then use the fields self.cacheKey or self.cacheIndex.
+    A CtMap can be layered on top of a parent CtMap, in which case it only stores its own changes and defers all other
+    lookups to the parent. This lets many maps share the contents of a common parent instead of each copying it, so
+    extending a map costs time proportional to the extension rather than to the whole map. A parent must not be
+    modified once another map has been layered on top of it.
     """
+    # Once a chain of layers gets this deep, a new layer copies its parents' contents instead of linking to them, so
+    # that lookups never have to walk a long chain.
+    MAX_DEPTH = 8
+    # Marks a key that was deleted in a layer while still being present in one of its parents
+    _DELETED = object()
 
-    def __init__(self):
+    def __init__(self, parent=None):
         """
-        :self.keys: The set of keys, each corresponds to the same index in values
-        :self.values: The set of values, each corresponds to the same index in keys
-        :self.cacheKey: the most recently used key, or None, if the value could not be found. This is kept in sync with
-                        self.cacheIndex
-        :self.cacheIndex: The most recently used index, or -1 if the value could not be found. This is kept in sync with
-                            self.cacheKey
+        :self.local: The keys and values set in this layer
+        :self.parent: The CtMap this layer was placed on top of, or None
+        :self.depth: The number of parents below this layer
+        :self.has_deletions: Whether a key was ever deleted from this layer while present in one of its parents
+        :param parent: The CtMap whose contents this map should start with
         """
-        self.keys = []
-        self.values = []
-        self.cacheKey = None
-        self.cacheIndex = -1
+        self.local = {}
+        self.parent = None
+        self.depth = 0
+        self.has_deletions = False
+        if parent is not None and (parent.local or parent.parent is not None):
+            if parent.depth >= CtMap.MAX_DEPTH:
+                self.local = parent.to_dict()
+            else:
+                self.parent = parent
+                self.depth = parent.depth + 1
+
+    def _find(self, key):
+        """
+        :param key: The key to look for
+        :return: the value associated with key, or _DELETED if it cannot be found
+        """
+        layer = self
+        while layer is not None:
+            if key in layer.local:
+                return layer.local[key]
+            layer = layer.parent
+        return CtMap._DELETED
 
-    def update_cache(self, key):
+    def to_dict(self):
         """
-        Updates the cache
-        :param key: The key to be cached
+        :return: a new dictionary holding the contents of this map, in the order the keys were first set
         """
-        if self.cacheIndex == -1 or self.cacheKey != key:
-            self.cacheKey = key
-            if key in self.keys:
-                self.cacheIndex = self.keys.index(key)
+        if self.parent is None:
+            return dict(self.local)
+        contents = self.parent.to_dict()
+        for key, value in self.local.items():
+            if value is CtMap._DELETED:
+                contents.pop(key, None)
             else:
-                self.cacheIndex = -1
+                contents[key] = value
+        return contents
 
-    def clear_cache(self):
-        self.cacheKey = None
-        self.cacheIndex = -1
+    def iter_items(self):
+        """
+        Iterates over the contents of this map in the order the keys were first set, without copying the layers into
+        a new dictionary. Each key is looked up in at most every layer, so stopping early (e.g., after the first few
+        items) only costs as much as the items that were read.
+        :return: a generator of (key, value) tuples
+        """
+        layers = []
+        layer = self
+        while layer is not None:
+            if layer.has_deletions:
+                # A deleted key that is set again moves to the end, which only a full copy gets right
+                for item in self.to_dict().items():
+                    yield item
+                return
+            layers.append(layer)
+            layer = layer.parent
+        for layer in reversed(layers):
+            for key in layer.local:
+                # Keys set in a lower layer keep that layer's position
+                if layer.parent is None or layer.parent._find(key) is CtMap._DELETED:
+                    yield key, self._find(key)
 
     def clear(self):
         """
-        Empties map and clears the cache
+        Empties map
         """
-        self.keys = []
-        self.values = []
-        self.clear_cache()
+        self.local = {}
+        self.parent = None
+        self.depth = 0
+        self.has_deletions = False
 
     def delete(self, key):
         """
         deletes value associated with the key, and then the key, in that order.
         :param key: The key to be deleted
         """
-        self.update_cache(key)
-        if self.cacheIndex != -1:
-            del self.values[self.cacheIndex]
-            del self.keys[self.cacheIndex]
-        self.clear_cache()
+        if self.parent is not None and self.parent._find(key) is not CtMap._DELETED:
+            self.local[key] = CtMap._DELETED
+            self.has_deletions = True
+        elif key in self.local:
+            del self.local[key]
 
     def get(self, key):
-        self.update_cache(key)
-        if self.cacheIndex == -1:
+        value = self._find(key)
+        if value is CtMap._DELETED:
             raise IndexError
-        return self.values[self.cacheIndex]
+        return value
 
     def has(self, key):
-        self.update_cache(key)
-        return self.cacheIndex >= 0
+        return self._find(key) is not CtMap._DELETED
 
+    @property
     def keys(self):
-        return self.keys
+        return [key for key, value in self.iter_items()]
 
+    @property
     def values(self):
-        return self.values
+        return [value for key, value in self.iter_items()]
+
+    def items(self):
+        return list(self.iter_items())
 
     def set(self, key, value):
-        self.update_cache(key)
-        if self.cacheIndex == -1:
-            self.keys.append(key)
-            self.values.append(value)
-        else:
-            self.values[self.cacheIndex] = value
+        self.local[key] = value
 
     def size(self):
-        return len(self.keys)
+        return sum(1 for item in self.iter_items())
 
     def __str__(self):
         # return ''.join(["keys = ", self.keys.__str__(), ", values = ", self.values.__str__()])
         collector = ""
-        for key, value in zip(self.keys, self.values):
-            collector += '{}[{}: {}], '.format(collector, key, value)
-            #collector = ''.join([collector, "[", key, ": ", value.__str__(), "], "])
+        for key, value in self.items():
+            collector += '[{}: {}], '.format(key, value)
         return collector
 
     def __repr__(self):
         collector = ""
-        for key, value in zip(self.keys, self.values):
-            collector = ''.join([collector, "[", key, ": ", value.__str__(), "], "])
+        for key, value in self.items():
+            collector = ''.join([collector, "[", str(key), ": ", value.__str__(), "], "])
         return collector
@@ -1,6 +1,7 @@
 import ast
 import pedal.cait.ast_helpers as ast_str
-from types import MethodType
+from pedal.cait.compact_tree import CompactTree
+from pedal.cait.numeric_logic import CompiledLogic, compile_expression, are_equivalent
 from pedal.report import Report, Feedback, MAIN_REPORT
 
 class EasyNode:
@@ -25,12 +26,22 @@ class EasyNode:
         self.parent = ancestor
         if lin_tree is None:
             self.linear_tree = [self]
+            self.compact = CompactTree()
         else:
             lin_tree.append(self)
             self.linear_tree = lin_tree
-
-        # reference to the easy node wrapping the ast_node
-        setattr(ast_node, 'easy_node', self)
+            self.compact = ancestor.compact
+        self.compact.add(type(ast_node), -1 if ancestor is None else ancestor.tree_id)
+        # Nodes are indexed in preorder, so each list of tree_ids stays sorted
+        node_type = type(ast_node).__name__
+        add_to_index(self.compact.type_index, node_type, tid)
+        if node_type == "Constant":
+            # Newer Pythons parse literals as Constants, but they can still be found by their old names (e.g., "Num")
+            legacy_type = get_legacy_constant_name(ast_node.value)
+            if legacy_type is not None:
+                add_to_index(self.compact.type_index, legacy_type, tid)
+        elif node_type == "Name":
+            add_to_index(self.compact.name_index, ast_node.id, tid)
 
         tid_count = tid
 
@@ -57,135 +68,54 @@ class EasyNode:
                                          ancestor=self)
                     self.children.append(new_child)
                     tid_count = len(self.linear_tree) - 1
+        # The subtree rooted here occupies linear_tree[tree_id:subtree_end]
+        self.compact.close(self.tree_id, [child.tree_id for child in self.children])
+
+    @property
+    def subtree_end(self):
+        return self.compact.subtree_ends[self.tree_id]
+
+    @property
+    def height(self):
+        return self.compact.heights[self.tree_id]
+
+    @property
+    def type_code(self):
+        return self.compact.type_codes[self.tree_id]
+
+    @property
+    def type_index(self):
+        return self.compact.type_index
+
+    @property
+    def name_index(self):
+        return self.compact.name_index
 
     def __str__(self):
         return ''.join([self.field, "\n", ast_str.dump(self.astNode)])
 
-    def numeric_logic_check(self, mag, expr):
+    def numeric_logic_check(self, mag, expr, density=1, probes=None):
         """
         If this node is a Compare or BoolOp node, sees if the logic in expr (a javascript string being a logical
-        statement) matches the logic of self. This assumes that we are only comparing numerical values to a single
-        variable
-        TODO: modify this to take multiple variables
-        TODO: modify to support more than +, -, *, and / BinOps
-        TODO: modify to support unary operators other than USub and Not
+        statement) matches the logic of self. Both are compiled into predicates (see pedal.cait.numeric_logic) and
+        evaluated at probe values placed around every number in either expression; with several variables, every
+        combination of probe values is tried.
         :param mag: the order of magnitude that should be added to numbers to check logic, 1 is usually a good value,
                     especially when working with the set of integers.
         :param expr: the "Compare" or "BoolOp" tree to check self against
+        :param density: how many probes to place on either side of each number, spaced mag apart
+        :param probes: any other values that should be probed
         :return: True if self (typically student node) and expr are equivalent boolean expressions
         """
-
-        def eval_unop(unop_num, unop_node):
-            operand = eval_selector(unop_num, unop_node.operand)
-            op = unop_node.op_name
-
-            return {"USub": -operand,
-                    "Not": not operand}[op]
-
-        def eval_binop(binop_num, binop_node):
-            left = eval_selector(binop_num, binop_node.left)
-            right = eval_selector(binop_num, binop_node.right)
-            op = binop_node.op_name
-
-            return {
-                "Add": left + right,
-                "Sub": left - right,
-                "Mult": left * right,
-                "Div": left/right}[op]
-
-        def eval_selector(op_num, op_expr):
-            op_expr = op_num if op_expr.ast_name == "Name" else op_expr
-            if isinstance(op_expr, (int, float)):
-                return op_expr
-            if op_expr.ast_name == "BinOp":
-                return eval_binop(op_num, op_expr)
-            if op_expr.ast_name == "UnaryOp":
-                return eval_unop(op_num, op_expr)
-            if op_expr.ast_name == "Num":
-                return op_expr.n
-            raise NotImplementedError
-
-        def eval_bool_comp(num_list, comp_ast):
-            ops = comp_ast.ops_names
-            comps = comp_ast.comparators
-            results = []
-            current = comp_ast.left
-            left = current
-
-            for num_i in num_list:
-                result = True
-                for op, comp in zip(ops, comps):
-                    current = eval_selector(num_i, current)
-                    comp_p = eval_selector(num_i, comp)
-
-                    res = {
-                        "Eq": current == comp_p,
-                        "NotEq": current != comp_p,
-                        "Lt": current < comp_p,
-                        "LtE": current <= comp_p,
-                        "Gt": current > comp_p,
-                        "GtE": current >= comp_p,
-                    }[op]
-                    current = comp
-                    result = result and res
-                    if not result:
-                        break
-                results.append(result)
-                current = left
-            return results
-
-        def eval_boolop(num_list, boolop_ast):
-            boolop = boolop_ast.op_name
-            values = boolop_ast.values
-            results_c = None
-            is_and = boolop == "And"
-            for value in values:
-                if value.ast_name == "Compare":
-                    results = eval_bool_comp(num_list, value)
-                else:  # should be boolop
-                    results = eval_boolop(num_list, value)
-                if results_c is None:
-                    results_c = results
-                else:  # compile results
-                    new_result = []
-                    for result1, result2 in zip(results_c, results):
-                        if is_and:
-                            new_result.append(result1 and result2)
-                        else:
-                            new_result.append(result1 or result2)
-                    results_c = new_result
-            return results_c
-
-        ins_expr = EasyNode(ast.parse(expr)).body[0].value
-        ins_nums = ins_expr.find_all("Num")
-        std_nums = self.find_all("Num")
-        test_nums = []
-        for num in ins_nums:
-            raw_num = num.n
-            test_nums.append(raw_num)
-            test_nums.append(raw_num + mag)
-            test_nums.append(raw_num - mag)
-        for num in std_nums:
-            raw_num = num.n
-            test_nums.append(raw_num)
-            test_nums.append(raw_num + mag)
-            test_nums.append(raw_num - mag)
-
-        if self.ast_name == "Compare":
-            std_res = eval_bool_comp(test_nums, self)
-        elif self.ast_name == "BoolOp":
-            std_res = eval_boolop(test_nums, self)
-        else:
+        if self.ast_name not in ("Compare", "BoolOp"):
             return False
-
-        if ins_expr.ast_name == "Compare":
-            ins_res = eval_bool_comp(test_nums, ins_expr)
-        elif ins_expr.ast_name == "BoolOp":
-            ins_res = eval_boolop(test_nums, ins_expr)
-        else:
+        ins_logic = compile_expression(expr)
+        if type(ins_logic.node).__name__ not in ("Compare", "BoolOp"):
             raise TypeError
-
-        return ins_res == std_res
+        std_logic = self.compiled_logic
+        if std_logic is None:
+            std_logic = self.compiled_logic = CompiledLogic(self.astNode)
+        return are_equivalent(std_logic, ins_logic, mag, density, probes)
 
     def get_next_tree(self):
         """Gets the next tree in the AST
@@ -194,23 +124,9 @@ class EasyNode:
         TODO: Create a get sibling method.
         :return: The next tree in the AST
         """
-
-        # adding function to track tree ids
-        def visit_counter(self, node):
-            self.counter += 1
-            self.generic_visit(node)
-
-        node_counter = ast.NodeVisitor()
-        setattr(node_counter, 'counter', self.tree_id)
-        node_counter.visit = MethodType(visit_counter, node_counter)
-
-        # getting ids
-        node_counter.visit(self.astNode)
-        out_of_tree = node_counter.counter >= len(self.linear_tree)  # check if out of bounds
-        # len(self.children) > 0 and self.children[-1] == node_counter
-        if out_of_tree:
+        if self.subtree_end >= len(self.linear_tree):
             return None
-        return self.linear_tree[node_counter.counter]
+        return self.linear_tree[self.subtree_end]
 
     def get_child(self, node):
         """
@@ -226,67 +142,48 @@ class EasyNode:
             return self.children(node)
         return None
 
+    def _wrap(self, child):
+        """
+        Finds the child wrapping an ast node among this node's own children. The ast may be shared by several trees of
+        EasyNodes (e.g., through the SOURCE_CACHE), so nothing is stored on the ast nodes themselves.
+        :param child: an ast node found in one of this node's fields
+        :return: the easy node wrapping child
+        """
+        children = self.__dict__.get('_children_by_id')
+        wrapped = None if children is None else children.get(id(child))
+        if wrapped is None or wrapped.astNode is not child:
+            children = self.__dict__['_children_by_id'] = {id(node.astNode): node for node in self.children}
+            wrapped = children.get(id(child))
+            if wrapped is None or wrapped.astNode is not child:
+                raise AttributeError
+        return wrapped
+
     @staticmethod
     def get_ast_name(node):
         return type(node).__name__
 
     def __getattr__(self, item):
-        key = item
-        '''
-        Non-ast node attributes based on ast_node attributes
-        '''
-        node_name = EasyNode.get_ast_name(self.astNode)
-        if node_name == "Assign" and key == "target":
-            key = "targets"
-        if item in AST_SINGLE_FUNCTIONS:
-            key = item[:-5]  # strip suffix '_name'
-        if item in AST_ARRAYS_OF_FUNCTIONS:
-            key = item[:-6]  # strip suffix '_names'
-
-        '''
-        Non-ast node attributes
-        '''
-        if key == 'next_tree':
-            return self.get_next_tree()
-        if key == 'ast_name':
-            return node_name
-        elif key == '_name':
-            return self.astNode.name
-        else:  # ast node attributes or derivative attributes
-            if hasattr(self.astNode, key):
-                # noinspection PyBroadException
-                try:
-                    field = self.astNode.__getattribute__(key)
-                except Exception:
-                    field = None
-                if node_name == "Assign" and item != key:
-                    if item == "target":
-                        return field[0].easy_node  # Get's the relevant ast node
-                    elif item == "targets" and isinstance(field, list):
-                        easy_array = []
-                        for node in field:
-                            easy_array.append(node.easy_node)
-                        return easy_array
-                    else:
-                        return field
-                elif item in AST_SINGLE_FUNCTIONS:
-                    return type(field).__name__
-                elif item in AST_ARRAYS_OF_FUNCTIONS:
-                    str_ops_list = []
-                    for op in field:
-                        str_ops_list.append(type(op).__name__)
-                        return str_ops_list
-                elif isinstance(field, ast.AST):
-                    return field.easy_node
-                elif isinstance(field, list):
-                    try:
-                        return [f.easy_node for f in field]
-                    except AttributeError:
-                        # This can only happen in NonLocals, which has a list
-                        # of raw strings in the `names` property
-                        return field
-                else:
-                    return field
+        """
+        Non-ast node attributes based on ast_node attributes, looked up through the accessor generated for this kind
+        of ast node. Anything other than a list is remembered on this node, so later accesses skip __getattr__
+        entirely; lists are remembered too, but each access gets its own copy.
+        """
+        # Special methods looked up by the likes of pickle and copy, and the wrapped node itself while a node is still
+        # being restored, are never derived from the ast node
+        if item == 'astNode' or (item.startswith('__') and item.endswith('__')):
+            raise AttributeError(item)
+        field_lists = self.__dict__.get('_field_lists')
+        if field_lists is not None and item in field_lists:
+            return list(field_lists[item])
+        value = get_accessor(type(self.astNode), item)(self)
+        if isinstance(value, list):
+            if field_lists is None:
+                field_lists = self.__dict__['_field_lists'] = {}
+            field_lists[item] = value
+            return list(value)
+        if value is not None:
+            self.__dict__[item] = value
+        return value
 
     def find_all(self, node_type):
         """Finds all nodes defined by string node_type
@@ -295,50 +192,154 @@ class EasyNode:
         :return: a list of Ast Nodes (easy_nodes) of self that are of the specified type (including self if self
                     meets that criteria)
         """
-        items = []
-        visitor = ast.NodeVisitor()
-        # setattr(visitor, "current_id", self.tree_id - 1)
-        setattr(visitor, "items", items)
-        func_name = 'visit_' + node_type
-
-        def main_visit(self, node):
-            self.items.append(node.easy_node)
-            return self.generic_visit(node)
-
-        func_ref = main_visit
-        setattr(visitor, func_name, MethodType(func_ref, visitor))
-        visitor.visit(self.astNode)
-        return visitor.items
-    
+        start, end, tree_ids = self.compact.subtree_range(self.compact.type_index, node_type, self.tree_id)
+        return [self.linear_tree[tree_id] for tree_id in tree_ids[start:end]]
+
+    def count_all(self, node_type):
+        """Counts the nodes defined by string node_type, without building the list that find_all would
+
+        :param node_type: the string representing the "type" of node to look for
+        :return: the number of nodes of self that are of the specified type (including self)
+        """
+        return self.compact.count_all(self.tree_id, node_type)
+
+    def has_name(self, name_id):
+        """
+        :param name_id: the id of a variable
+        :return: True if a Name node with the given id is found in this subtree
+        """
+        return self.compact.has_name(self.tree_id, name_id)
+
     def has(self, node):
+        """Determines whether a number or a variable occurs within this subtree
+
+        :param node: an int or float value, or a Name EasyNode whose id should be looked for
+        :return: True if the value or name is found in this subtree
+        """
         if isinstance(node, (int, float)):
-            visitor = ast.NodeVisitor()
-            has_num = []
-
-            def visit_Num(self, potential):
-                has_num.append(node == potential.n)
-                return self.generic_visit(potential)
-            visitor.visit_Num = MethodType(visit_Num, visitor)
-            visitor.visit(self.astNode)
-            return any(has_num)
+            return any(node == potential.n for potential in self.find_all("Num"))
         elif node.ast_name != "Name":
             return False
-        visitor = ast.NodeVisitor()
-        has_name = []
-
-        def visit_Name(self, potential):
-            has_name.append(node.id == potential.id)
-            return self.generic_visit(potential)
-        visitor.visit_Name = MethodType(visit_Name, visitor)
-        visitor.visit(self.astNode)
-        return any(has_name)
+        return self.has_name(node.id)
 
     def is_before(self, other):
         try:
-            return self.tree_id < other.tree_id and self.linear_tree == other.linear_tree
+            return self.tree_id < other.tree_id and self.linear_tree is other.linear_tree
+        except Exception:
+            raise TypeError
+
+    def is_ancestor(self, other):
+        """Determines whether other is a (proper) descendant of this node, using the preorder subtree extents
+
+        :param other: an EasyNode
+        :return: True if other is found below this node in the same tree
+        """
+        try:
+            return (self.linear_tree is other.linear_tree and
+                    self.tree_id < other.tree_id < self.subtree_end)
+        except Exception:
+            raise TypeError
+
+    def is_descendant(self, other):
+        """Determines whether this node is found below other in the same tree
+
+        :param other: an EasyNode
+        :return: True if other is a (proper) ancestor of this node
+        """
+        try:
+            return other.is_ancestor(self)
         except Exception:
             raise TypeError
 
 
 AST_SINGLE_FUNCTIONS = ["ctx_name", "op_name"]
 AST_ARRAYS_OF_FUNCTIONS = ["ops_names"]
+# Maps each ast node class to a dictionary of the accessors already generated for its attributes
+ACCESSOR_TABLES = {}
+# The deprecated node types that Constants used to be parsed as, checked in order (bool must come before int)
+LEGACY_CONSTANT_NAMES = [(bool, "NameConstant"), (type(None), "NameConstant"), (int, "Num"), (float, "Num"),
+                         (complex, "Num"), (str, "Str"), (bytes, "Bytes"), (type(...), "Ellipsis")]
+
+
+def add_to_index(index, key, tree_id):
+    if key not in index:
+        index[key] = []
+    index[key].append(tree_id)
+
+
+def get_legacy_constant_name(value):
+    """Finds the deprecated node type name (e.g., "Num") that a Constant with the given value used to be parsed as
+
+    :param value: the value of the Constant node
+    :return: the name of the deprecated node type, or None if there isn't one
+    """
+    for value_type, name in LEGACY_CONSTANT_NAMES:
+        if isinstance(value, value_type):
+            return name
+    return None
+
+
+def get_accessor(node_class, item):
+    """Finds the function that EasyNode.__getattr__ uses to compute an attribute for one kind of ast node, generating
+    it the first time that attribute is asked for on that kind of node
+
+    :param node_class: the class of the wrapped ast node
+    :param item: the name of the attribute
+    :return: a function that takes an EasyNode and returns the attribute's value
+    """
+    table = ACCESSOR_TABLES.get(node_class)
+    if table is None:
+        table = ACCESSOR_TABLES[node_class] = {}
+    accessor = table.get(item)
+    if accessor is None:
+        accessor = table[item] = make_accessor(node_class, item)
+    return accessor
+
+
+def make_accessor(node_class, item):
+    """
+    :param node_class: the class of the wrapped ast node
+    :param item: the name of the attribute
+    :return: a function that takes an EasyNode and returns the attribute's value
+    """
+    if item == 'next_tree':
+        return lambda easy_node: easy_node.get_next_tree()
+    if item == 'ast_name':
+        node_name = node_class.__name__
+        return lambda easy_node: node_name
+    if item == '_name':
+        return lambda easy_node: easy_node.astNode.name
+    if node_class is ast.Assign and item == "target":
+        # Get's the relevant ast node
+        return lambda easy_node: easy_node._wrap(easy_node.astNode.targets[0])
+    if item in AST_SINGLE_FUNCTIONS:
+        key = item[:-5]  # strip suffix '_name'
+
+        def get_function_name(easy_node):
+            if not hasattr(easy_node.astNode, key):
+                return None
+            return type(getattr(easy_node.astNode, key, None)).__name__
+        return get_function_name
+    if item in AST_ARRAYS_OF_FUNCTIONS:
+        key = item[:-6]  # strip suffix '_names'
+
+        def get_function_names(easy_node):
+            if not hasattr(easy_node.astNode, key):
+                return None
+            return [type(op).__name__ for op in getattr(easy_node.astNode, key)]
+        return get_function_names
+
+    def get_field(easy_node):
+        # ast node attributes or derivative attributes
+        field = getattr(easy_node.astNode, item, None)
+        if isinstance(field, ast.AST):
+            return easy_node._wrap(field)
+        elif isinstance(field, list):
+            try:
+                return [easy_node._wrap(f) for f in field]
+            except AttributeError:
+                # This can only happen in NonLocals, which has a list
+                # of raw strings in the `names` property
+                return field
+        return field
+    return get_field
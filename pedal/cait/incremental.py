@@ -0,0 +1,130 @@
+import ast
+from difflib import SequenceMatcher
+from pedal.cait.ast_map import AstMap, AstSymbol
+from pedal.cait.stretchy_tree_matching import StretchyTreeMatcher
+
+
+class AnalyzedProgram:
+    """
+    The parts of one submission's analysis that the next submission might reuse.
+
+    :self.std_ast: the EasyNode of the submission
+    :self.signatures: a structural fingerprint of each top-level statement, which ignores positions
+    :self.origins: for each top-level statement, the index of the identical statement in the previous submission, or
+                   None if it was added or changed
+    :self.matches: maps (matcher, cut, check_meta) to a list holding, for each top-level statement, the matches found
+                   within it
+    """
+
+    def __init__(self, std_ast, previous=None):
+        self.std_ast = std_ast
+        self.signatures = [ast.dump(statement.astNode) for statement in std_ast.children]
+        self.origins = [None] * len(self.signatures)
+        self.matches = {}
+        if previous is not None:
+            aligned = SequenceMatcher(None, previous.signatures, self.signatures, autojunk=False)
+            for block in aligned.get_matching_blocks():
+                for offset in range(block.size):
+                    self.origins[block.b + offset] = block.a + offset
+
+
+class IncrementalMatcher:
+    """
+    Keeps the analysis of the previous submission around so that feedback given while a student is typing only has to
+    search the top-level statements (including whole function definitions) that were edited. Matches within an
+    unchanged statement are carried over from the previous submission and moved onto the new tree; matches that
+    involve the module itself span every statement, so they are always searched again.
+
+    The IncrementalMatcher used by use_incremental_matching is kept in the report's cait namespace, so it only ever
+    compares submissions made to the same report, and is dropped along with the rest of the report by clear_report.
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.current = None
+
+    def start(self, std_ast):
+        """
+        Compares a new submission against the last one, unless it is the submission already being analyzed
+        :param std_ast: the EasyNode of the new submission
+        """
+        if self.current is not None and self.current.std_ast is std_ast:
+            return
+        self.previous = self.current
+        self.current = AnalyzedProgram(std_ast, self.previous)
+
+    def clear(self):
+        self.previous = None
+        self.current = None
+
+    def find_matches(self, matcher, std_ast, check_meta=True, cut=False):
+        """Apply Tree Inclusion, reusing the matches within statements that did not change
+
+        :param matcher: the StretchyTreeMatcher for the pattern
+        :param std_ast: the EasyNode of the submission; anything but the one last passed to start is simply searched,
+                        as is any pattern with type constraints
+        :param check_meta: Flag, if True, check whether nodes originated from the same ast field
+        :param cut: set to true to trim root to first branch
+        :return: the same result as matcher.find_matches
+        """
+        # The types of unchanged statements' variables can still change, so type-constrained patterns are not reused
+        if self.current is None or self.current.std_ast is not std_ast or matcher.is_type_constrained():
+            return matcher.find_matches(std_ast, check_meta=check_meta, cut=cut)
+        key = (matcher, cut, check_meta)
+        explore_root = matcher.get_explore_root(cut)
+        summary = matcher.summarize(explore_root)
+        statement_matches = []
+        self.current.matches[key] = statement_matches
+        if not matcher.may_contain(summary, std_ast):
+            statement_matches.extend([] for _ in std_ast.children)
+            return False
+        matches = list(matcher.match_at(explore_root, std_ast, std_ast, check_meta))
+        for index, statement in enumerate(std_ast.children):
+            found = self.reuse_matches(key, index, statement)
+            if found is None:
+                found = list(matcher.iter_subtree_matches(explore_root, summary, statement, check_meta))
+            statement_matches.append(found)
+            matches.extend(found)
+        if matches:
+            return matches
+        return False
+
+    def reuse_matches(self, key, index, statement):
+        """
+        :param key: the (matcher, cut, check_meta) of the search
+        :param index: the index of a top-level statement in the current submission
+        :param statement: the EasyNode of that statement
+        :return: the matches within the identical statement of the previous submission, moved onto statement, or
+                 None if they are not available
+        """
+        origin = self.current.origins[index]
+        if origin is None or self.previous is None or key not in self.previous.matches:
+            return None
+        old_statement = self.previous.std_ast.children[origin]
+        return [move_match(match, old_statement, statement) for match in self.previous.matches[key][origin]]
+
+
+def move_match(match, old_top, new_top):
+    """Copies a match found within old_top onto the identical subtree new_top
+
+    :param match: an AstMap whose student nodes are all within old_top's subtree
+    :param old_top: the root of the subtree the match was found in
+    :param new_top: the root of an identical subtree
+    :return: a new AstMap pairing the same instructor nodes with the corresponding nodes of new_top
+    """
+    offset = new_top.tree_id - old_top.tree_id
+    linear_tree = new_top.linear_tree
+
+    def move(std_node):
+        return linear_tree[std_node.tree_id + offset]
+    moved = AstMap()
+    for ins_node, std_node in match.mappings.items():
+        moved.mappings.set(ins_node, move(std_node))
+    for key, symbols in match.symbol_table.items():
+        moved.symbol_table.set(key, [AstSymbol(symbol.id, move(symbol.astNode)) for symbol in symbols])
+    for key, std_node in match.exp_table.items():
+        moved.exp_table.set(key, move(std_node))
+    moved.conflict_keys = list(match.conflict_keys)
+    StretchyTreeMatcher.locate_matches([moved], new_top)
+    return moved
+
@@ -0,0 +1,127 @@
+import ast
+import json
+from time import perf_counter
+
+# The counters kept for every pattern, in the order they are exported
+STAT_NAMES = ('searches', 'deep_find_match_calls', 'shallow_match_calls', 'mappings_created', 'mappings_discarded',
+              'matches', 'time')
+
+
+def get_pattern_label(matcher):
+    """
+    :param matcher: a StretchyTreeMatcher
+    :return: the source of the matcher's pattern, which identifies it in a profile
+    """
+    if matcher.source is not None:
+        return matcher.source
+    if matcher.rootNode is None:
+        return "<empty pattern>"
+    unparse = getattr(ast, "unparse", ast.dump)
+    return unparse(matcher.rootNode.astNode)
+
+
+class MatcherProfile:
+    """
+    Measures how much work each instructor pattern costs while it is matched against student code. Matchers are only
+    instrumented for the duration of a search that is run through the profile, so matchers that are not being
+    profiled (including the same, shared matchers when used for other reports) run exactly as fast as before.
+
+    :self.patterns: maps each pattern's label to a dictionary of its counters (see STAT_NAMES); time is in seconds
+    :self.stacks: maps each stack of instructor node types (prefixed by the pattern's label) to the seconds spent in
+                  deep_find_match at the top of that stack, not counting the calls it made
+    """
+
+    def __init__(self):
+        self.patterns = {}
+        self.stacks = {}
+
+    def get_stats(self, matcher):
+        """
+        :param matcher: a StretchyTreeMatcher
+        :return: the counters for matcher's pattern, creating them if necessary
+        """
+        label = get_pattern_label(matcher)
+        if label not in self.patterns:
+            self.patterns[label] = dict.fromkeys(STAT_NAMES, 0)
+            self.patterns[label]['time'] = 0.0
+        return self.patterns[label]
+
+    def run(self, matchers, search):
+        """Runs a search with every one of matchers instrumented
+
+        :param matchers: the StretchyTreeMatchers used by the search
+        :param search: a function that performs the search
+        :return: the result of search
+        """
+        watched = [matcher for matcher in matchers if 'deep_find_match' not in matcher.__dict__]
+        counters = [(matcher.mapping_count, matcher.discard_count) for matcher in watched]
+        for matcher in watched:
+            self.watch(matcher)
+        try:
+            return search()
+        finally:
+            for matcher, (mapping_count, discard_count) in zip(watched, counters):
+                del matcher.deep_find_match
+                del matcher.shallow_match
+                stats = self.get_stats(matcher)
+                stats['searches'] += 1
+                stats['mappings_created'] += matcher.mapping_count - mapping_count
+                stats['mappings_discarded'] += matcher.discard_count - discard_count
+
+    def watch(self, matcher):
+        """
+        Shadows matcher's deep_find_match and shallow_match with counting and timing versions on the instance itself;
+        run removes them again once the search is over.
+        :param matcher: the StretchyTreeMatcher to instrument
+        """
+        stats = self.get_stats(matcher)
+        stack = [get_pattern_label(matcher).replace("\n", "\\n").replace(";", ",")]
+        # The time spent in the calls made by each call on the stack, so that calls are only charged for their own time
+        callee_times = []
+        deep_find_match = matcher.deep_find_match
+        shallow_match = matcher.shallow_match
+
+        def timed_deep_find_match(ins_node, std_node, check_meta=True):
+            stats['deep_find_match_calls'] += 1
+            stack.append(type(ins_node.astNode).__name__)
+            callee_times.append(0.0)
+            result = None
+            start = perf_counter()
+            try:
+                result = deep_find_match(ins_node, std_node, check_meta)
+                return result
+            finally:
+                elapsed = perf_counter() - start
+                path = tuple(stack)
+                self.stacks[path] = self.stacks.get(path, 0.0) + elapsed - callee_times.pop()
+                stack.pop()
+                if callee_times:
+                    callee_times[-1] += elapsed
+                else:
+                    stats['time'] += elapsed
+                    if result:
+                        stats['matches'] += len(result)
+
+        def counted_shallow_match(ins_node, std_node, check_meta=True):
+            stats['shallow_match_calls'] += 1
+            return shallow_match(ins_node, std_node, check_meta)
+        matcher.deep_find_match = timed_deep_find_match
+        matcher.shallow_match = counted_shallow_match
+
+    def to_json(self, indent=None):
+        """
+        :param indent: passed on to json.dumps
+        :return: the counters of every pattern, as a JSON object keyed by the patterns' source
+        """
+        return json.dumps(self.patterns, indent=indent)
+
+    def to_folded(self):
+        """
+        Exports the time spent in each stack of instructor nodes in the "folded stacks" format read by flame graph
+        tools: one line per stack, with the frames separated by semicolons, followed by the microseconds spent there.
+        :return: the folded stacks, as a str
+        """
+        lines = []
+        for path, seconds in sorted(self.stacks.items()):
+            lines.append("{} {}".format(";".join(path), max(0, int(round(seconds * 1000000)))))
+        return "\n".join(lines)
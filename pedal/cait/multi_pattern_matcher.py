@@ -0,0 +1,89 @@
+from pedal.cait.stretchy_tree_matching import StretchyTreeMatcher, EXPRESSION, WILDCARD
+
+
+class MultiPatternMatcher:
+    """
+    Searches a student tree for many instructor patterns in a single walk. Patterns are grouped by the type of student
+    node that their root can be paired with, so each student node is only compared against the patterns that could
+    start there. The results are the same as calling find_matches on each StretchyTreeMatcher separately.
+    """
+
+    def __init__(self, matchers):
+        """
+        :param matchers: a list of instructor patterns, either as StretchyTreeMatchers or as code
+        """
+        self.matchers = [matcher if isinstance(matcher, StretchyTreeMatcher) else StretchyTreeMatcher(matcher)
+                         for matcher in matchers]
+        self._dispatches = {}
+
+    @staticmethod
+    def get_root_type(matcher, ins_node):
+        """
+        :param matcher: the StretchyTreeMatcher that ins_node belongs to
+        :param ins_node: the root of the instructor pattern
+        :return: the type code (see pedal.cait.compact_tree) of the student nodes that ins_node can be paired with, or
+                 None if it can be paired with any node
+        """
+        ast_name = type(ins_node.astNode).__name__
+        if ast_name in ("Module", "Expr", "Pass"):
+            return None
+        if ast_name == "Name" and matcher.get_name_kind(ins_node) in (EXPRESSION, WILDCARD):
+            return None
+        return ins_node.type_code
+
+    def get_dispatch(self, cut=False):
+        """
+        Groups the patterns by the type of their root, once for each setting of cut
+        :param cut: set to true to trim roots to first branch
+        :return: a tuple of a dictionary mapping student node type codes to the indices of the patterns that can start
+                 at such nodes, and the list of indices of the patterns that can start at any node
+        """
+        if cut not in self._dispatches:
+            by_type = {}
+            any_type = []
+            for index, matcher in enumerate(self.matchers):
+                root_type = self.get_root_type(matcher, matcher.get_explore_root(cut))
+                if root_type is None:
+                    any_type.append(index)
+                else:
+                    if root_type not in by_type:
+                        by_type[root_type] = []
+                    by_type[root_type].append(index)
+            self._dispatches[cut] = (by_type, any_type)
+        return self._dispatches[cut]
+
+    def find_matches(self, other, filename="__main__", check_meta=True, cut=False):
+        """Apply Tree Inclusion for every pattern at once
+
+        :param other: student code, as a str, an AST, or an EasyNode
+        :param filename: the filename to parse str code with
+        :param check_meta: Flag, if True, check whether nodes originated from the same ast field
+        :param cut: set to true to trim roots to first branch
+        :return: a list holding the matches for each pattern (or False if it had none), in the order of self.matchers
+        """
+        easy_other = StretchyTreeMatcher.as_easy_node(other, filename)
+        by_type, any_type = self.get_dispatch(cut)
+        explore_roots = [matcher.get_explore_root(cut) for matcher in self.matchers]
+        summaries = [matcher.summarize(root) for matcher, root in zip(self.matchers, explore_roots)]
+        # A pattern whose summary rules out a subtree is skipped until the walk leaves that subtree
+        skip_until = [0] * len(self.matchers)
+        results = [[] for _ in self.matchers]
+        match_root = easy_other
+        compact = easy_other.compact
+        for tree_id in range(easy_other.tree_id, easy_other.subtree_end):
+            std_node = easy_other.linear_tree[tree_id]
+            # Like any_node_match, matches below the root are credited to the root's child they were found in
+            if compact.parents[tree_id] == easy_other.tree_id:
+                match_root = std_node
+            for index in by_type.get(compact.type_codes[tree_id], []) + any_type:
+                if tree_id < skip_until[index]:
+                    continue
+                matcher = self.matchers[index]
+                if not matcher.may_contain_at(summaries[index], compact, tree_id):
+                    skip_until[index] = compact.subtree_ends[tree_id]
+                    continue
+                matching = matcher.deep_find_match(explore_roots[index], std_node, check_meta)
+                if matching:
+                    matcher.locate_matches(matching, match_root)
+                    results[index].extend(matching)
+        return [matching if matching else False for matching in results]
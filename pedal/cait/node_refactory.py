@@ -157,7 +157,7 @@ def _find_all(self, node_type):
     func_name = 'visit_' + node_type
 
     def main_visit(self, node):
-        self.items.append(node.easy_node)
+        self.items.append(node)
         return self.generic_visit(node)
 
     func_ref = main_visit
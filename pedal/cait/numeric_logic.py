@@ -0,0 +1,305 @@
+"""
+Compiles numeric boolean expressions (e.g., "24 < x < 35 or x == 0") into predicates, so that two expressions can be
+checked for logical equivalence by evaluating both at many probe values. When NumPy is available, every probe is
+evaluated at once over arrays; otherwise each probe is evaluated in pure Python, with the same results.
+"""
+import ast
+import itertools
+import math
+import operator
+import random
+from functools import lru_cache, reduce
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+INF = float('inf')
+# The most points that are probed. Past this, rather than every combination of probe values, points are sampled so
+# that each probe value still appears equally often for every variable.
+MAX_POINTS = 20000
+# Seeds the sampling, so that the same expressions always get the same verdict
+SAMPLE_SEED = 0
+
+
+def _python_div(left, right):
+    if right == 0:
+        if left == 0 or left != left:
+            return NAN
+        return math.copysign(INF, left) * math.copysign(1.0, right)
+    return left / right
+
+
+def _python_floordiv(left, right):
+    if right == 0:
+        return _python_div(left, right)
+    return left // right
+
+
+def _python_mod(left, right):
+    if right == 0:
+        return NAN
+    return left % right
+
+
+def _python_pow(left, right):
+    try:
+        result = left ** right
+    except (ZeroDivisionError, OverflowError):
+        # Like NumPy, an odd integer power keeps the sign of the base
+        if right == int(right) and int(right) % 2 == 1:
+            return math.copysign(INF, left)
+        return INF
+    if isinstance(result, complex):
+        return NAN
+    return result
+
+
+def _numpy_safely(function):
+    def safe_function(*args):
+        with numpy.errstate(all='ignore'):
+            return function(*args)
+    return safe_function
+
+
+# Each backend maps the name of an operation to the function that performs it
+PYTHON_BACKEND = {
+    'Add': operator.add, 'Sub': operator.sub, 'Mult': operator.mul, 'Div': _python_div,
+    'FloorDiv': _python_floordiv, 'Mod': _python_mod, 'Pow': _python_pow,
+    'USub': operator.neg, 'UAdd': operator.pos, 'Not': lambda operand: not operand,
+    'Eq': operator.eq, 'NotEq': operator.ne, 'Lt': operator.lt, 'LtE': operator.le, 'Gt': operator.gt,
+    'GtE': operator.ge,
+    'And': lambda left, right: bool(left) and bool(right), 'Or': lambda left, right: bool(left) or bool(right),
+    'abs': abs, 'min': min, 'max': max
+}
+if numpy is not None:
+    NUMPY_BACKEND = {
+        'Add': numpy.add, 'Sub': numpy.subtract, 'Mult': numpy.multiply, 'Div': _numpy_safely(numpy.true_divide),
+        'FloorDiv': _numpy_safely(numpy.floor_divide),
+        # Python's % takes the sign of the divisor, which numpy.mod also does, but a zero divisor should give nan
+        'Mod': _numpy_safely(lambda left, right: numpy.where(
+            numpy.equal(right, 0), NAN, numpy.mod(left, numpy.where(numpy.equal(right, 0), 1, right)))),
+        'Pow': _numpy_safely(lambda left, right: numpy.power(numpy.asarray(left, dtype=float), right)),
+        'USub': numpy.negative, 'UAdd': numpy.positive, 'Not': numpy.logical_not,
+        'Eq': numpy.equal, 'NotEq': numpy.not_equal, 'Lt': numpy.less, 'LtE': numpy.less_equal,
+        'Gt': numpy.greater, 'GtE': numpy.greater_equal,
+        'And': numpy.logical_and, 'Or': numpy.logical_or,
+        'abs': numpy.abs, 'min': lambda *args: reduce(numpy.minimum, args),
+        'max': lambda *args: reduce(numpy.maximum, args)
+    }
+else:
+    NUMPY_BACKEND = None
+
+
+class CompiledLogic:
+    """
+    A numeric expression compiled into a predicate over its variables.
+
+    :self.node: the ast node of the expression
+    :self.variables: the names of the variables in the expression, in the order they first appear
+    :self.constants: the numeric literals in the expression
+    """
+
+    def __init__(self, node):
+        """
+        :param node: the ast node of the expression
+        """
+        self.node = node
+        self.variables = []
+        self.constants = []
+        self._collect(node)
+        self._compiled = {}
+
+    def _collect(self, node):
+        functions = set(id(child.func) for child in ast.walk(node) if isinstance(child, ast.Call))
+        names = []
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                if id(child) not in functions:
+                    names.append(child)
+            else:
+                value = get_number(child)
+                if value is not None:
+                    self.constants.append(value)
+        # ast.walk is breadth-first, so the names are put back in the order they were written
+        names.sort(key=lambda name: (getattr(name, 'lineno', 0), getattr(name, 'col_offset', 0)))
+        for name in names:
+            if name.id not in self.variables:
+                self.variables.append(name.id)
+
+    def get_predicate(self, vectorized):
+        """
+        :param vectorized: whether to compile for NumPy arrays instead of single Python numbers
+        :return: a function that takes a dictionary mapping each variable to its value(s) and returns the result(s)
+        """
+        if vectorized not in self._compiled:
+            backend = NUMPY_BACKEND if vectorized else PYTHON_BACKEND
+            self._compiled[vectorized] = compile_node(self.node, backend)
+        return self._compiled[vectorized]
+
+    def evaluate(self, columns, size, vectorized=None):
+        """Evaluates the expression at every probe point
+
+        :param columns: a dictionary mapping each variable to the list of its values at every probe point
+        :param size: the number of probe points
+        :param vectorized: whether to use NumPy, defaulting to whether it is available
+        :return: a list of the truth of the expression at each probe point
+        """
+        if vectorized is None:
+            vectorized = numpy is not None
+        predicate = self.get_predicate(vectorized)
+        if vectorized:
+            arrays = {name: numpy.asarray(values, dtype=float) for name, values in columns.items()}
+            results = numpy.broadcast_to(predicate(arrays), (size,))
+            return [bool(result) for result in results.astype(bool)]
+        return [bool(predicate({name: values[index] for name, values in columns.items()}))
+                for index in range(size)]
+
+
+def get_number(node):
+    """
+    :param node: an ast node
+    :return: the value of node if it is a numeric literal (not a bool), otherwise None
+    """
+    if type(node).__name__ == "Num":
+        return node.n
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    return None
+
+
+def compile_node(node, backend):
+    """Turns an expression into nested closures over the operations of a backend
+
+    :param node: the ast node of the expression
+    :param backend: PYTHON_BACKEND or NUMPY_BACKEND
+    :return: a function that takes a dictionary mapping each variable to its value(s) and returns the result(s)
+    """
+    node_name = type(node).__name__
+    if node_name == "Name":
+        name = node.id
+        return lambda values: values[name]
+    if node_name in ("Num", "Constant"):
+        value = node.n if node_name == "Num" else node.value
+        if not isinstance(value, (int, float)):
+            raise NotImplementedError
+        # Probes are floats, so literals are too; otherwise NumPy would do integer arithmetic on them
+        value = float(value)
+        return lambda values: value
+    if node_name == "BinOp":
+        function = get_operation(backend, node.op)
+        left, right = compile_node(node.left, backend), compile_node(node.right, backend)
+        return lambda values: function(left(values), right(values))
+    if node_name == "UnaryOp":
+        function = get_operation(backend, node.op)
+        operand = compile_node(node.operand, backend)
+        return lambda values: function(operand(values))
+    if node_name == "Compare":
+        operands = [compile_node(operand, backend) for operand in [node.left] + node.comparators]
+        functions = [get_operation(backend, op) for op in node.ops]
+        both = backend['And']
+
+        def compare(values):
+            results = [operand(values) for operand in operands]
+            result = functions[0](results[0], results[1])
+            for function, left, right in zip(functions[1:], results[1:], results[2:]):
+                result = both(result, function(left, right))
+            return result
+        return compare
+    if node_name == "BoolOp":
+        function = get_operation(backend, node.op)
+        operands = [compile_node(operand, backend) for operand in node.values]
+        return lambda values: reduce(function, [operand(values) for operand in operands])
+    if node_name == "Call" and isinstance(node.func, ast.Name) and node.func.id in ("abs", "min", "max"):
+        function = backend[node.func.id]
+        arguments = [compile_node(argument, backend) for argument in node.args]
+        return lambda values: function(*[argument(values) for argument in arguments])
+    raise NotImplementedError
+
+
+def get_operation(backend, op):
+    name = type(op).__name__
+    if name not in backend:
+        raise NotImplementedError
+    return backend[name]
+
+
+@lru_cache(maxsize=256)
+def compile_expression(expr):
+    """Compiles an instructor's expression, which only has to happen once per process
+
+    :param expr: the expression, as a str
+    :return: the CompiledLogic for it
+    """
+    return CompiledLogic(ast.parse(expr).body[0].value)
+
+
+def make_probes(logics, mag, density=1, extra=None):
+    """Chooses the values to probe each variable at: every numeric literal c in the expressions, along with
+    c + k*mag for every k between -density and density.
+
+    :param logics: the CompiledLogics to find literals in
+    :param mag: the spacing between probes around each literal
+    :param density: how many probes to place on either side of each literal
+    :param extra: any other values to probe
+    :return: a sorted list of probe values
+    """
+    constants = [constant for logic in logics for constant in logic.constants]
+    if not constants and not extra:
+        constants = [0]
+    probes = set(extra or [])
+    for constant in constants:
+        for k in range(-density, density + 1):
+            probes.add(constant + k * mag)
+    return sorted(probes)
+
+
+def are_equivalent(std_logic, ins_logic, mag, density=1, extra=None, vectorized=None):
+    """Determines whether two expressions agree at every probe point
+
+    Variables are paired by name when both expressions use the same names, and otherwise in the order they first
+    appear. Every combination of probe values is tried for every variable, unless there are more than MAX_POINTS of
+    them, in which case MAX_POINTS of them are sampled (see make_columns).
+    :param std_logic: the CompiledLogic of the student's expression
+    :param ins_logic: the CompiledLogic of the instructor's expression
+    :param mag: the spacing between probes around each literal
+    :param density: how many probes to place on either side of each literal
+    :param extra: any other values to probe
+    :param vectorized: whether to use NumPy, defaulting to whether it is available
+    :return: True if the expressions agree everywhere they were probed
+    """
+    probes = make_probes([std_logic, ins_logic], mag, density, extra)
+    if set(std_logic.variables) == set(ins_logic.variables):
+        ins_variables = std_variables = std_logic.variables
+    else:
+        std_variables, ins_variables = std_logic.variables, ins_logic.variables
+    dimensions = max(len(std_variables), len(ins_variables))
+    probes = [float(probe) for probe in probes]
+    columns, count = make_columns(probes, dimensions)
+    std_results = std_logic.evaluate(dict(zip(std_variables, columns)), count, vectorized)
+    ins_results = ins_logic.evaluate(dict(zip(ins_variables, columns)), count, vectorized)
+    return std_results == ins_results
+
+
+def make_columns(probes, dimensions, max_points=MAX_POINTS):
+    """Chooses the points to probe: every combination of probe values, or a Latin hypercube sample of max_points of
+    them if there are more combinations than that
+
+    :param probes: the values to probe
+    :param dimensions: the number of variables
+    :param max_points: the most points to probe
+    :return: a tuple of the values of each variable at every point (one list per variable), and the number of points
+    """
+    if len(probes) ** dimensions <= max_points:
+        points = list(itertools.product(probes, repeat=dimensions))
+        return [[point[dimension] for point in points] for dimension in range(dimensions)], len(points)
+    generator = random.Random(SAMPLE_SEED)
+    repeated = (probes * (max_points // len(probes) + 1))[:max_points]
+    columns = []
+    for dimension in range(dimensions):
+        column = list(repeated)
+        generator.shuffle(column)
+        columns.append(column)
+    return columns, max_points
@@ -0,0 +1,140 @@
+"""
+Saves compiled instructor patterns to a file, so that a fresh process can load them instead of compiling every pattern
+on first use. The patterns of a module are found by reading its source for calls to the cait API with literal
+patterns; patterns built at runtime (e.g., with str.format) are still compiled when they are first used.
+
+Bundles are pickles, so only load bundles that you built yourself.
+"""
+import ast
+import hashlib
+import importlib
+import inspect
+import pickle
+from pedal.cait.pattern_cache import PATTERN_CACHE, PatternCache
+from pedal.cait.stretchy_tree_matching import StretchyTreeMatcher
+
+# Bumped whenever the layout of compiled patterns (e.g., the attributes of EasyNode) changes
+BUNDLE_FORMAT = 5
+
+# The parameters of each cait API function that takes patterns, in positional order
+PATTERN_PARAMETERS = {
+    'find_match': ('ins_code', 'std_code', 'report', 'cut'),
+    'find_matches': ('ins_code', 'std_code', 'report', 'cut'),
+    'find_matches_many': ('ins_codes', 'std_code', 'report', 'cut'),
+    'find_expr_sub_matches': ('ins_expr', 'std_expr', 'as_expr', 'is_mod', 'cut'),
+    'find_sub_matches': ('match', 'exp_name', 'ins_expr', 'as_expr', 'is_mod', 'cut')
+}
+
+
+def get_grammar_stamp():
+    """
+    :return: a str identifying the bundle format and the node classes (and their fields) of this Python's AST grammar;
+             a bundle is only loaded by processes with the same stamp
+    """
+    node_classes = sorted((name, tuple(getattr(value, '_fields', ())))
+                          for name, value in vars(ast).items()
+                          if isinstance(value, type) and issubclass(value, ast.AST))
+    grammar = hashlib.sha256(repr(node_classes).encode('utf-8')).hexdigest()
+    return "{}-{}".format(BUNDLE_FORMAT, grammar[:16])
+
+
+def find_pattern_keys(module):
+    """Finds the literal patterns that a module passes to the cait API
+
+    :param module: a module, or the name of one
+    :return: a list of the PatternCache keys those patterns are cached under, without duplicates
+    """
+    if isinstance(module, str):
+        module = importlib.import_module(module)
+    keys = []
+    for node in ast.walk(ast.parse(inspect.getsource(module))):
+        if not isinstance(node, ast.Call):
+            continue
+        name = getattr(node.func, 'id', getattr(node.func, 'attr', None))
+        if name not in PATTERN_PARAMETERS:
+            continue
+        arguments = dict(zip(PATTERN_PARAMETERS[name], node.args))
+        arguments.update((keyword.arg, keyword.value) for keyword in node.keywords)
+        try:
+            cut = get_literal(arguments, 'cut', False)
+            if name in ('find_match', 'find_matches'):
+                found = [(get_literal(arguments, 'ins_code'), cut)]
+            elif name == 'find_matches_many':
+                found = [(ins_code, cut) for ins_code in get_literal(arguments, 'ins_codes')]
+            else:
+                found = [('sub', get_literal(arguments, 'ins_expr'), get_literal(arguments, 'as_expr', True),
+                          get_literal(arguments, 'is_mod', False))]
+        except (ValueError, TypeError):
+            continue
+        for key in found:
+            pattern = key[1] if key[0] == 'sub' else key[0]
+            if isinstance(pattern, str) and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def get_literal(arguments, parameter, default=None):
+    """
+    :param arguments: a dictionary mapping parameters to the ast nodes passed for them
+    :param parameter: the parameter to look up
+    :param default: the value of the parameter if it was not passed
+    :return: the value passed for parameter
+    :raises ValueError: if the value was not a literal
+    """
+    if parameter not in arguments:
+        return default
+    return ast.literal_eval(arguments[parameter])
+
+
+def compile_pattern(key):
+    """
+    :param key: a PatternCache key
+    :return: the compiled matcher for the key, with the summaries used by searches already computed
+    """
+    if key[0] == 'sub':
+        # Sub-patterns are searched both with and without cut
+        matcher = PatternCache.compile_sub(key[1], as_expr=key[2], is_mod=key[3])
+        matcher.summarize(matcher.get_explore_root(False))
+        matcher.summarize(matcher.get_explore_root(True))
+    else:
+        matcher = StretchyTreeMatcher(key[0])
+        matcher.summarize(matcher.get_explore_root(key[1]))
+    return matcher
+
+
+def save_bundle(path, modules):
+    """Compiles every literal pattern used by modules and saves them to a bundle
+
+    :param path: the file to write the bundle to
+    :param modules: a list of modules, or the names of modules
+    :return: the number of patterns saved
+    """
+    matchers = {}
+    for module in modules:
+        for key in find_pattern_keys(module):
+            if key not in matchers:
+                try:
+                    matchers[key] = compile_pattern(key)
+                except (SyntaxError, ValueError):
+                    # The pattern is broken, and will raise the same error whenever it is used
+                    continue
+    with open(path, 'wb') as bundle_file:
+        pickle.dump({'stamp': get_grammar_stamp(), 'matchers': matchers}, bundle_file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    return len(matchers)
+
+
+def load_bundle(path, cache=PATTERN_CACHE):
+    """Adds the patterns of a bundle to a PatternCache. A bundle saved by a different version of Python or pedal is
+    ignored, leaving the patterns to be compiled as usual.
+
+    :param path: the bundle file, as written by save_bundle
+    :param cache: the PatternCache to add the patterns to
+    :return: the number of patterns loaded
+    """
+    with open(path, 'rb') as bundle_file:
+        bundle = pickle.load(bundle_file)
+    if not isinstance(bundle, dict) or bundle.get('stamp') != get_grammar_stamp():
+        return 0
+    cache.preload(bundle['matchers'])
+    return len(bundle['matchers'])
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from pedal.cait.stretchy_tree_matching import StretchyTreeMatcher
+
+
+class PatternCache:
+    """
+    A process-wide cache of compiled instructor patterns. Parsing a pattern and wrapping it in EasyNodes only has to
+    happen once per process; afterwards, the same StretchyTreeMatcher is handed back for every check that uses that
+    pattern. The least recently used pattern is evicted once max_size patterns are held.
+
+    :self.hits: the number of lookups that were answered from the cache
+    :self.misses: the number of lookups that required compiling the pattern
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param max_size: the maximum number of compiled patterns to keep around
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._matchers = OrderedDict()
+
+    def get(self, ins_code, cut=False):
+        """Retrieves the compiled matcher for ins_code, compiling it if necessary
+
+        :param ins_code: Instructor pattern
+        :param cut: whether the matcher will be used to trim root to first branch
+        :return: the StretchyTreeMatcher for the pattern
+        """
+        if not isinstance(ins_code, str):
+            return StretchyTreeMatcher(ins_code)
+        key = (ins_code, cut)
+        if key in self._matchers:
+            self.hits += 1
+            self._matchers.move_to_end(key)
+            return self._matchers[key]
+        self.misses += 1
+        matcher = StretchyTreeMatcher(ins_code)
+        self._matchers[key] = matcher
+        if len(self._matchers) > self.max_size:
+            self._matchers.popitem(last=False)
+        return matcher
+
+    def get_sub(self, ins_expr, as_expr=True, is_mod=False):
+        """Retrieves the compiled matcher for a sub-pattern, as used by find_expr_sub_matches, compiling it if necessary
+
+        :param ins_expr: the sub-pattern (str that MUST evaluate to a Module node with a single child, unless is_mod)
+        :param as_expr: whether that child must be an expression
+        :param is_mod: whether to match the whole module rather than its single child
+        :return: the StretchyTreeMatcher for the sub-pattern, rooted at its single child unless is_mod
+        """
+        key = ('sub', ins_expr, as_expr, is_mod)
+        if key in self._matchers:
+            self.hits += 1
+            self._matchers.move_to_end(key)
+            return self._matchers[key]
+        self.misses += 1
+        matcher = self.compile_sub(ins_expr, as_expr, is_mod)
+        self._matchers[key] = matcher
+        if len(self._matchers) > self.max_size:
+            self._matchers.popitem(last=False)
+        return matcher
+
+    @staticmethod
+    def compile_sub(ins_expr, as_expr=True, is_mod=False):
+        """
+        :param ins_expr: the sub-pattern (str that MUST evaluate to a Module node with a single child, unless is_mod)
+        :param as_expr: whether that child must be an expression
+        :param is_mod: whether to match the whole module rather than its single child
+        :return: a new StretchyTreeMatcher for the sub-pattern, rooted at its single child unless is_mod
+        """
+        matcher = StretchyTreeMatcher(ins_expr)
+        if not is_mod:
+            if len(matcher.rootNode.children) != 1:
+                raise ValueError("ins_expr does not evaluate to a singular statement")
+            new_root = matcher.rootNode.children[0]
+            if as_expr and new_root.ast_name != "Expr":
+                raise ValueError("ins_expr does not evaluate to an Expr node or singular statement")
+            matcher.rootNode = new_root
+        return matcher
+
+    def preload(self, matchers):
+        """Adds already compiled matchers to the cache, e.g., from a bundle saved by pedal.cait.pattern_bundle
+
+        :param matchers: a dictionary mapping cache keys to their StretchyTreeMatchers
+        """
+        for key, matcher in matchers.items():
+            self._matchers[key] = matcher
+            self._matchers.move_to_end(key)
+            if len(self._matchers) > self.max_size:
+                self._matchers.popitem(last=False)
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters
+        """
+        self._matchers.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._matchers)}
+
+    def __len__(self):
+        return len(self._matchers)
+
+    def __contains__(self, key):
+        return key in self._matchers
+
+
+PATTERN_CACHE = PatternCache()
@@ -1,15 +1,90 @@
 import ast
+import copy
 import re
+from itertools import islice
 from pedal.cait.ast_map import *
 from pedal.cait.easy_node import *
+from pedal.tifa.type_definitions import TYPE_LOOKUPS, UnknownType
+
+
+# Kinds of instructor Name nodes
+VARIABLE = "variable"  # _var_ matches a student variable and records it in the symbol table
+EXPRESSION = "expression"  # __exp__ matches any student subtree and records it in the expression table
+WILDCARD = "wildcard"  # ___ matches any student subtree
+LITERAL = "literal"  # anything else must match the student's name exactly
+
+VAR_MATCH = re.compile('^_[^_].*_$')
+EXP_MATCH = re.compile('^__.*__$')
+WILD_CARD = re.compile('^___$')
+# A variable can be constrained to student variables of one TIFA type: _items__list_ only matches variables holding
+# lists, and _items__not_list_ only matches variables known to hold something else. _items__unknown_or_not_list_ also
+# matches variables whose type is not known (e.g., that were never defined). Either way, the variable is bound as
+# _items_.
+TYPE_CONSTRAINT = re.compile('^(_[^_].*?_)_(not_|unknown_or_not_)?([A-Za-z]+)_$')
+TYPE_NAMES = set(names[0] for names in TYPE_LOOKUPS.values())
+
+# Binary operators whose operands can be matched in any order and with any grouping
+COMMUTATIVE_OPS = ("Add", "Mult")
+
+# The most candidate mappings that a single merge step may produce before the remaining candidates are dropped
+MAX_MAPPINGS = 1000
 
 
 def is_primitive(item):
     return isinstance(item, (int, float, str, bool)) or item is None
 
 
+def classify_name(name_id):
+    """Determines what kind of metavariable, if any, an instructor's name represents
+
+    :param name_id: the id of an instructor Name node
+    :return: one of VARIABLE, EXPRESSION, WILDCARD, or LITERAL
+    """
+    if VAR_MATCH.match(name_id):
+        return VARIABLE
+    elif EXP_MATCH.match(name_id):
+        return EXPRESSION
+    elif WILD_CARD.match(name_id):
+        return WILDCARD
+    return LITERAL
+
+
+def parse_type_constraint(name_id):
+    """Reads the type constraint, if any, written into the name of a pattern variable
+
+    :param name_id: the id of an instructor Name node for a variable
+    :return: a tuple of the name the variable is bound as, the TIFA type name, whether the constraint is negated, and
+             whether variables of unknown type satisfy it; or False if the name is not constrained
+    """
+    constrained = TYPE_CONSTRAINT.match(name_id)
+    if not constrained or constrained.group(3) not in TYPE_NAMES:
+        return False
+    negation = constrained.group(2)
+    return constrained.group(1), constrained.group(3), bool(negation), negation == "unknown_or_not_"
+
+
 class StretchyTreeMatcher:
-    def __init__(self, code, filename="__main__"):
+    def __init__(self, code, filename="__main__", max_mappings=MAX_MAPPINGS, deduplicate=True):
+        """
+        :param code: the instructor pattern, as a str, an AST, or an EasyNode
+        :param filename: the filename to parse str code with
+        :param max_mappings: the most candidate mappings that a single merge step may produce, or None for no limit
+        :param deduplicate: whether to collapse candidate mappings whose symbols and expressions are bound to the same
+                            student nodes, keeping the first
+        :self.mapping_count: the number of candidate mappings generated by this matcher so far
+        :self.truncation_count: the number of merge steps that dropped candidates for reaching max_mappings so far
+        :self.source: the pattern's source code, if it was given as a str
+        :self.discard_count: the number of candidate mappings thrown away so far, for conflicting, being duplicates, or
+                             going past max_mappings
+        :self.cut_root: the root the pattern had when it was last cut, and the node that searches with cut start from
+        """
+        self.max_mappings = max_mappings
+        self.deduplicate = deduplicate
+        self.mapping_count = 0
+        self.truncation_count = 0
+        self.discard_count = 0
+        self.cut_root = None
+        self.source = code if isinstance(code, str) else None
         if isinstance(code, str):
             ast_node = ast.parse(code, filename)
         else:
@@ -20,24 +95,199 @@ class StretchyTreeMatcher:
             self.rootNode = ast_node
         else:
             self.rootNode = EasyNode(ast_node, "none")
+        if self.rootNode is not None:
+            self.classify_names(self.rootNode)
+
+    @staticmethod
+    def classify_names(root):
+        """
+        Tags every Name node in the pattern with its kind of metavariable, so that the regular expressions only have to
+        run once per pattern rather than once per comparison with a student node.
+        :param root: the root of the instructor pattern
+        """
+        for ins_node in root.find_all("Name"):
+            ins_node.name_kind = classify_name(ins_node.astNode.id)
+            if ins_node.name_kind == VARIABLE:
+                ins_node.type_constraint = parse_type_constraint(ins_node.astNode.id)
+
+    @staticmethod
+    def get_name_kind(ins_node):
+        """
+        :param ins_node: an instructor Name node
+        :return: the kind of metavariable that ins_node represents
+        """
+        name_kind = ins_node.name_kind
+        if name_kind is None:  # The node was not part of a compiled pattern
+            name_kind = ins_node.name_kind = classify_name(ins_node.astNode.id)
+        return name_kind
+
+    @staticmethod
+    def get_type_constraint(ins_node):
+        """
+        :param ins_node: an instructor Name node for a variable
+        :return: the type constraint on ins_node (see parse_type_constraint)
+        """
+        constraint = ins_node.type_constraint
+        if constraint is None:  # The node was not part of a compiled pattern
+            constraint = ins_node.type_constraint = parse_type_constraint(ins_node.astNode.id)
+        return constraint
+
+    def is_type_constrained(self):
+        """
+        :return: whether any variable in the pattern is constrained to a type, in which case the matches depend on the
+                 types of the student's variables as well as on the student's code
+        """
+        if self.rootNode is None:
+            return False
+        return any(self.get_type_constraint(ins_node) for ins_node in self.rootNode.find_all("Name")
+                   if self.get_name_kind(ins_node) == VARIABLE)
+
+    @staticmethod
+    def get_variable_types(std_root):
+        """
+        Finds the variable_types table on the root of a student's tree. The matcher does not analyze student code
+        itself, so whoever searches a tree with a type-constrained pattern must attach the table first (as
+        pedal.cait.cait_api does).
+        :param std_root: the root of a student's tree
+        :return: a dict mapping each top-level variable's name to its TIFA type
+        :raises ValueError: if no table was attached to the tree
+        """
+        variable_types = std_root.variable_types
+        if variable_types is None:
+            raise ValueError("Type-constrained patterns need the variable_types of the student's tree")
+        return variable_types
+
+    @staticmethod
+    def satisfies_type(constraint, std_node):
+        """
+        Checks a student variable against a type constraint, using the variable_types table of the student's tree
+        (see get_variable_types). A variable whose type is not known satisfies neither _x__list_ nor _x__not_list_: it
+        is not known to be a list, nor known not to be one. It does satisfy _x__unknown_or_not_list_.
+        :param constraint: a type constraint (see parse_type_constraint)
+        :param std_node: a student Name node
+        :return: whether the variable satisfies the constraint
+        """
+        name, type_name, negated, allows_unknown = constraint
+        variable_types = StretchyTreeMatcher.get_variable_types(std_node.linear_tree[0])
+        variable_type = variable_types.get(std_node.astNode.id)
+        if variable_type is None or isinstance(variable_type, UnknownType):
+            return allows_unknown
+        return variable_type.is_instance(type_name) != negated
 
     def find_matches(self, other, filename="__main__", check_meta=True, cut=False):
         # TODO: check that both are ast nodes at the module level
+        # return self.any_node_match(self.rootNode, easy_other, check_meta=check_meta)
+        matches = list(self.iter_matches(other, filename, check_meta=check_meta, cut=cut))
+        if matches:
+            return matches
+        return False
+
+    def iter_matches(self, other, filename="__main__", check_meta=True, cut=False):
+        """Apply Tree Inclusion lazily, producing the same matches in the same order as find_matches
+
+        The student tree is walked in preorder, and the search at a student node only happens once every match found
+        at the nodes before it has been consumed, so callers that only need the first match can stop early.
+        :param other: student code, as a str, an AST, or an EasyNode
+        :param filename: the filename to parse str code with
+        :param check_meta: Flag, if True, check whether nodes originated from the same ast field
+        :param cut: set to true to trim root to first branch
+        :return: a generator of matches
+        """
+        easy_other = self.as_easy_node(other, filename)
+        explore_root = self.get_explore_root(cut)
+        summary = self.summarize(explore_root)
+        if not self.may_contain(summary, easy_other):
+            return
+        for match in self.match_at(explore_root, easy_other, easy_other, check_meta):
+            yield match
+        # Like any_node_match, matches below the root are credited to the root's child they were found in
+        for std_child in easy_other.children:
+            for match in self.iter_subtree_matches(explore_root, summary, std_child, check_meta):
+                yield match
+
+    def match_at(self, explore_root, std_node, match_root, check_meta=True):
+        """
+        :param explore_root: the node of the pattern that the search starts from
+        :param std_node: the student node to pair explore_root with
+        :param match_root: the student node to record as the root of the matches
+        :param check_meta: Flag, if True, check whether nodes originated from the same ast field
+        :return: the matches whose root is paired with std_node, or an empty list
+        """
+        matching = self.deep_find_match(explore_root, std_node, check_meta)
+        if not matching:
+            return []
+        self.locate_matches(matching, match_root)
+        return matching
+
+    def iter_subtree_matches(self, explore_root, summary, top, check_meta=True):
+        """
+        Finds the matches anywhere within top's subtree, all credited to top. These only depend on the contents of the
+        subtree, so they can be reused for an identical subtree elsewhere.
+        :param explore_root: the node of the pattern that the search starts from
+        :param summary: the summary of explore_root
+        :param top: the student node whose subtree should be searched
+        :param check_meta: Flag, if True, check whether nodes originated from the same ast field
+        :return: a generator of matches, in preorder
+        """
+        compact = top.compact
+        tree_id = top.tree_id
+        end = compact.subtree_ends[tree_id]
+        while tree_id < end:
+            # Subtrees are ruled out from the tree's arrays, without looking at their EasyNodes
+            if not self.may_contain_at(summary, compact, tree_id):
+                tree_id = compact.subtree_ends[tree_id]
+                continue
+            for match in self.match_at(explore_root, top.linear_tree[tree_id], top, check_meta):
+                yield match
+            tree_id += 1
+
+    @staticmethod
+    def as_easy_node(other, filename="__main__"):
+        """
+        :param other: student code, as a str, an AST, or an EasyNode
+        :param filename: the filename to parse str code with
+        :return: the EasyNode for the student code
+        """
         if isinstance(other, str):
             other_tree = ast.parse(other, filename)
         else:
             other_tree = other
         if isinstance(other_tree, EasyNode):
-            easy_other = other_tree
-        else:
-            easy_other = EasyNode(other_tree, "none")
-        explore_root = self.rootNode
-        if cut and (self.rootNode is not None):
+            return other_tree
+        return EasyNode(other_tree, "none")
+
+    def get_explore_root(self, cut=False):
+        """
+        :param cut: set to true to trim root to first branch
+        :return: the node of the pattern that the search should start from
+        """
+        if not cut or self.rootNode is None:
+            return self.rootNode
+        # The cut root is a copy of the pattern node, so that ignoring its field only affects searches with cut
+        cut_root = self.cut_root
+        if cut_root is None or cut_root[0] is not self.rootNode:
+            explore_root = self.rootNode
             while len(explore_root.children) == 1:
                 explore_root = explore_root.children[0]
+            if explore_root is not self.rootNode:
+                explore_root = copy.copy(explore_root)
                 explore_root.field = "none"
-        # return self.any_node_match(self.rootNode, easy_other, check_meta=check_meta)
-        return self.any_node_match(explore_root, easy_other, check_meta=check_meta, cut=cut)
+                explore_root.summary = None
+            cut_root = self.cut_root = (self.rootNode, explore_root)
+        return cut_root[1]
+
+    @staticmethod
+    def locate_matches(matching, std_node):
+        """
+        Records std_node as the root of each match, along with the line that each match starts on
+        :param matching: a list of matches
+        :param std_node: the student node to consider the root of the matches
+        """
+        for match in matching:
+            match.match_root = std_node
+            # Only the first two pairings are needed, so the rest of the mappings are never read
+            first_values = [value for key, value in islice(match.mappings.iter_items(), 2)]
+            match.match_lineno = first_values[-1].lineno
 
     '''
     Finds whether ins_node can be matched to some node in the tree std_node
@@ -48,16 +298,14 @@ class StretchyTreeMatcher:
     def any_node_match(self, ins_node, std_node, check_meta=True, cut=False):
         # @TODO: create a more public function that converts ins_node and std_node into EasyNodes
         # TODO: Create exhaustive any_node_match
+        # if std_node's subtree is missing something the pattern needs, neither it nor its descendants can match
+        if not self.may_contain(self.summarize(ins_node), std_node):
+            return False
         # matching: an object representing the mapping and the symbol table
         matching = self.deep_find_match(ins_node, std_node, check_meta)
         # if a direct matching is found
         if matching:
-            for match in matching:
-                match.match_root = std_node
-                if len(match.mappings.values) > 1:
-                    match.match_lineno = match.mappings.values[1].lineno
-                else:
-                    match.match_lineno = match.mappings.values[0].lineno
+            self.locate_matches(matching, std_node)
         else:
             matching = []
         #    return matching  # return it
@@ -66,18 +314,89 @@ class StretchyTreeMatcher:
         for std_child in std_node.children:
             matching_c = self.any_node_match(ins_node, std_child, check_meta=check_meta, cut=cut)
             if matching_c:
-                for match in matching_c:
-                    match.match_root = std_child
-                    if len(match.mappings.values) > 1:
-                        match.match_lineno = match.mappings.values[1].lineno
-                    else:
-                        match.match_lineno = match.mappings.values[0].lineno
+                self.locate_matches(matching_c, std_child)
                 # return matching
                 matching = matching + matching_c
         if len(matching) > 0:
             return matching
         return False
 
+    def summarize(self, ins_node):
+        """
+        Summarizes what a student subtree must contain for ins_node to match anywhere within it. Every instructor node
+        is paired with a different student node, one level deeper for each level of the pattern, so the summary holds
+        lower bounds on the size and height of the subtree, the number of nodes of each type (leaving out node types
+        that can match to anything), and the literal variable names that must appear. The summary is computed once and
+        stored on ins_node.
+        :param ins_node: The root of the instructor pattern
+        :return: a dictionary of the required 'size', 'height', node 'types' (mapped to counts), and 'names'
+        """
+        summary = ins_node.summary
+        if summary is None:
+            summary = {'size': 0, 'height': 0, 'types': {}, 'names': set()}
+            summary['height'] = self._summarize_node(ins_node, summary)
+            ins_node.summary = summary
+        return summary
+
+    def _summarize_node(self, ins_node, summary):
+        """
+        Adds the requirements of ins_node's subtree to summary
+        :param ins_node: The instructor node being summarized
+        :param summary: The summary being built up
+        :return: the height of the part of the subtree that must be paired with student nodes
+        """
+        summary['size'] += 1
+        ast_name = type(ins_node.astNode).__name__
+        if ast_name == "Name":
+            name_kind = self.get_name_kind(ins_node)
+            if name_kind == EXPRESSION or name_kind == WILDCARD:
+                return 1
+            elif name_kind == LITERAL:
+                summary['names'].add(ins_node.astNode.id)
+        elif ast_name == "Expr":
+            value = ins_node.value
+            if value.ast_name == "Name" and self.get_name_kind(value) in (EXPRESSION, WILDCARD):
+                return 1
+        # Modules, Exprs, and Passes can be paired with any kind of student node
+        if ast_name not in ("Module", "Expr", "Pass"):
+            summary['types'][ast_name] = summary['types'].get(ast_name, 0) + 1
+        heights = [self._summarize_node(child, summary) for child in ins_node.children]
+        if ast_name == "BinOp" and type(ins_node.astNode.op).__name__ in COMMUTATIVE_OPS:
+            # A chain of the operator can be regrouped, so its nested links need not be any deeper in the student code
+            op = type(ins_node.astNode.op)
+            heights = [height - 1 if child.ast_name == "BinOp" and isinstance(child.astNode.op, op) else height
+                       for child, height in zip(ins_node.children, heights)]
+        return 1 + max(heights or [0])
+
+    @staticmethod
+    def may_contain(summary, std_node):
+        """
+        Quickly rules out student subtrees that cannot contain a match for a pattern
+        :param summary: The summary of the instructor pattern, as given by summarize
+        :param std_node: The root of the student subtree
+        :return: False if the pattern cannot match anywhere within std_node's subtree, True if it might
+        """
+        return StretchyTreeMatcher.may_contain_at(summary, std_node.compact, std_node.tree_id)
+
+    @staticmethod
+    def may_contain_at(summary, compact, tree_id):
+        """
+        Like may_contain, for the subtree at tree_id in a student tree's CompactTree
+        :param summary: The summary of the instructor pattern, as given by summarize
+        :param compact: The CompactTree of the student tree
+        :param tree_id: The root of the student subtree
+        :return: False if the pattern cannot match anywhere within the subtree, True if it might
+        """
+        if not compact.fits(tree_id, summary['size'], summary['height']):
+            return False
+        for node_type, count in summary['types'].items():
+            if compact.count_all(tree_id, node_type) < count:
+                return False
+        for name_id in summary['names']:
+            if not compact.has_name(tree_id, name_id):
+                return False
+        return True
+
     def deep_find_match(self, ins_node, std_node, check_meta=True):
         """
         Finds whether ins_node and matches std_node and whether ins_node's children flexibly match std_node's children
@@ -93,23 +412,20 @@ class StretchyTreeMatcher:
 
     # noinspection PyPep8Naming
     def deep_find_match_Name(self, ins_node, std_node, check_meta=True):
-        name_id = ins_node.astNode.id
-        var_match = re.compile('^_[^_].*_$')  # /regex
-        exp_match = re.compile('^__.*__$')  # /regex
-        wild_card = re.compile('^___$')  # /regex
+        name_kind = self.get_name_kind(ins_node)
         mapping = AstMap()
         matched = False
         meta_matched = self.metas_match(ins_node, std_node, check_meta)
-        if var_match.match(name_id) and meta_matched:  # if variable
+        if name_kind == VARIABLE and meta_matched:  # if variable
             # This if body is probably unnecessary.
             if type(std_node.astNode).__name__ == "Name":
                 return self.deep_find_match_generic(ins_node, std_node, check_meta)
         # could else return False, but shallow_match_generic should do this as well
-        elif exp_match.match(name_id):  # and meta_matched:  # if expression
+        elif name_kind == EXPRESSION:  # and meta_matched:  # if expression
             # terminate recursion, the whole subtree should match since expression nodes match to anything
             mapping.add_exp_to_sym_table(ins_node, std_node)
             matched = True
-        elif wild_card.match(name_id) and meta_matched:  # if wild card, don't care
+        elif name_kind == WILDCARD and meta_matched:  # if wild card, don't care
             # terminate the recursion, the whole subtree should match since wild cards match to anything
             matched = True
 
@@ -123,11 +439,106 @@ class StretchyTreeMatcher:
     def deep_find_match_BinOp(self, ins_node, std_node, check_meta=True):
         op = ins_node.astNode.op
         op = type(op).__name__
-        is_generic = not (op == "Mult" or op == "Add")
+        is_generic = op not in COMMUTATIVE_OPS
         if is_generic:
             return self.deep_find_match_generic(ins_node, std_node, check_meta)
-        else:  # this means that the node is clearly commutative
-            return self.deep_find_match_binflex(ins_node, std_node, False)
+        # this means that the node is clearly commutative, and associative too
+        ins_chain, ins_operands = self.flatten_chain(ins_node, op)
+        if len(ins_operands) > 2:
+            std_chain, std_operands = self.flatten_chain(std_node, op)
+            if len(std_operands) == len(ins_operands):
+                return self.deep_find_match_chain(ins_chain, ins_operands, std_chain, std_operands)
+        return self.deep_find_match_binflex(ins_node, std_node, False)
+
+    @staticmethod
+    def flatten_chain(node, op):
+        """
+        Flattens a chain of the same associative operator, however it is parenthesized (e.g., a + (b + c) and
+        (a + b) + c both have the operands a, b, and c)
+        :param node: the root of the chain
+        :param op: the name of the operator
+        :return: a tuple of the BinOp nodes that make up the chain, and the operands they combine, from left to right
+        """
+        chain = []
+        operands = []
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if type(current.astNode).__name__ == "BinOp" and type(current.astNode.op).__name__ == op:
+                chain.append(current)
+                pending.append(current.children[2])
+                pending.append(current.children[0])
+            else:
+                operands.append(current)
+        return chain, operands
+
+    def deep_find_match_chain(self, ins_chain, ins_operands, std_chain, std_operands):
+        """
+        Matches a chain of a commutative and associative operator as a multiset, pairing each instructor operand with a
+        different student operand in any order. Each operand is only matched against each student operand once, and the
+        partial pairings are bounded like any other candidate mappings, so long chains take polynomial time rather than
+        branching on every pair of operands the way deep_find_match_binflex does. Once a symbol only occurs in operands
+        that have been paired, its binding can no longer affect the rest of the match, so pairings of the same student
+        operands that only differ in such bindings are collapsed rather than returning every permutation.
+        :param ins_chain: the BinOp nodes of the instructor chain, starting with its root
+        :param ins_operands: the operands of the instructor chain
+        :param std_chain: the BinOp nodes of the student chain, starting with its root
+        :param std_operands: the operands of the student chain, of which there are as many as instructor operands
+        :return: a list of mappings, or False if the chains don't match
+        """
+        base_mappings = self.shallow_match(ins_chain[0], std_chain[0], False)
+        if not base_mappings:
+            return False
+        # The chains have as many links as operands, less one, so their links are paired in order whatever the grouping
+        base_map = base_mappings[0]
+        for ins_link, std_link in zip(ins_chain, std_chain):
+            base_map.add_node_pairing(ins_link, std_link)
+            base_map.add_node_pairing(ins_link.children[1], std_link.children[1])
+        candidates = [[self.deep_find_match(ins_operand, std_operand, False) for std_operand in std_operands]
+                      for ins_operand in ins_operands]
+        # the operands with the fewest candidates are paired first, to rule out mismatches as early as possible
+        order = sorted(range(len(ins_operands)), key=lambda index: sum(1 for found in candidates[index] if found))
+        # each mapping is kept with the set of student operands it has used, which plays the role of a sibling
+        maps, used = [base_map], [frozenset()]
+        paired = []
+        for ins_index in order:
+            new_maps, new_used = [], []
+            for mapping, used_operands in zip(maps, used):
+                for std_index, found in enumerate(candidates[ins_index]):
+                    if not found or std_index in used_operands:
+                        continue
+                    for sub_mapping in found:
+                        new_map = mapping.new_merged_map(sub_mapping)
+                        self.mapping_count += 1
+                        if new_map.has_conflicts():
+                            self.discard_count += 1
+                            continue
+                        new_maps.append(new_map)
+                        new_used.append(used_operands | {std_index})
+            paired.append(ins_operands[ins_index])
+            maps, used = self.bound_mappings(new_maps, new_used, self.get_settled_symbols(paired))
+            if not maps:
+                return False
+        return maps
+
+    @staticmethod
+    def get_settled_symbols(ins_nodes):
+        """
+        :param ins_nodes: instructor subtrees of the same pattern that have already been matched
+        :return: the names of the symbols and expressions that occur nowhere else in the pattern
+        """
+        compact = ins_nodes[0].compact
+        ranges = [(ins_node.tree_id, ins_node.subtree_end) for ins_node in ins_nodes]
+        inside, outside = set(), set()
+        for name_id, tree_ids in compact.name_index.items():
+            constraint = parse_type_constraint(name_id)
+            key = constraint[0] if constraint else name_id
+            for tree_id in tree_ids:
+                if any(start <= tree_id < end for start, end in ranges):
+                    inside.add(key)
+                else:
+                    outside.add(key)
+        return inside - outside
 
     # noinspection PyMethodMayBeStatic
     def binflex_helper(self, case_left, case_right, new_mappings, base_mappings):
@@ -144,6 +555,7 @@ class StretchyTreeMatcher:
                 new_map = base_mappings[0].new_merged_map(case_l)
                 for case_r in case_right:
                     both = new_map.new_merged_map(case_r)
+                    self.mapping_count += 1
                     new_mappings.append(both)
 
     def deep_find_match_binflex(self, ins_node, std_node, check_meta=False):
@@ -171,7 +583,7 @@ class StretchyTreeMatcher:
             self.binflex_helper(case_left, case_right, new_mappings, base_mappings)
             if len(new_mappings) == 0:
                 return False
-            return new_mappings
+            return self.bound_mappings(new_mappings, [None] * len(new_mappings))[0]
         return False
 
     def deep_find_match_Expr(self, ins_node, std_node, check_meta=True):
@@ -190,16 +602,14 @@ class StretchyTreeMatcher:
         value = ins_node.value
         ast_type = type(value.astNode).__name__
         if ast_type == "Name":
-            name_id = value.astNode.id
-            exp_match = re.compile('^__.*__$')  # /regex
-            wild_card = re.compile('^___$')  # /regex
+            name_kind = self.get_name_kind(value)
             matched = False
             meta_matched = self.metas_match(ins_node, std_node, check_meta)
-            if exp_match.match(name_id):  # and meta_matched:  # if expression
+            if name_kind == EXPRESSION:  # and meta_matched:  # if expression
                 # terminate recursion, the whole subtree should match since expression nodes match to anything
                 mapping.add_exp_to_sym_table(value, std_node)
                 matched = True
-            elif wild_card.match(name_id) and meta_matched:  # if wild card, don't care
+            elif name_kind == WILDCARD and meta_matched:  # if wild card, don't care
                 # terminate the recursion, the whole subtree should match since wild cards match to anything
                 matched = True
             if matched:
@@ -274,9 +684,13 @@ class StretchyTreeMatcher:
                 if runSib > base_sib:
                     for run_mapsub in run_map:
                         new_map = baseMap.new_merged_map(run_mapsub)
+                        self.mapping_count += 1
                         if not new_map.has_conflicts():  # if it's a valid mapping
                             new_maps.append(new_map)
                             new_sibs.append(runSib)
+                        else:
+                            self.discard_count += 1
+        new_maps, new_sibs = self.bound_mappings(new_maps, new_sibs)
         map_update = None
         if len(new_maps) != 0:
             map_update = dict()
@@ -285,6 +699,35 @@ class StretchyTreeMatcher:
             map_update['youngest_sib'] = youngest_sib
         return map_update
 
+    def bound_mappings(self, maps, sibs, settled=()):
+        """
+        Keeps the candidate mappings of a merge step from growing without bound. Mappings with the same bindings that
+        end at the same student sibling can be extended in exactly the same ways, so only the first of them is kept;
+        past max_mappings, the remaining candidates are dropped.
+
+        :param maps: the candidate mappings
+        :param sibs: the student sibling that each mapping ends at
+        :param settled: the names of symbols and expressions whose bindings no longer matter (see get_settled_symbols)
+        :return: a tuple of the mappings that were kept and their siblings
+        """
+        candidate_count = len(maps)
+        if self.deduplicate and len(maps) > 1:
+            seen = set()
+            kept_maps = []
+            kept_sibs = []
+            for mapping, sib in zip(maps, sibs):
+                key = (sib, mapping.get_bindings_key(settled))
+                if key not in seen:
+                    seen.add(key)
+                    kept_maps.append(mapping)
+                    kept_sibs.append(sib)
+            maps, sibs = kept_maps, kept_sibs
+        if self.max_mappings is not None and len(maps) > self.max_mappings:
+            self.truncation_count += 1
+            maps, sibs = maps[:self.max_mappings], sibs[:self.max_mappings]
+        self.discard_count += candidate_count - len(maps)
+        return maps, sibs
+
     # noinspection PyMethodMayBeStatic,PyPep8Naming,PyUnusedLocal
     def shallow_match_Module(self, ins_node, std_node, check_meta=True):
         """
@@ -301,28 +744,32 @@ class StretchyTreeMatcher:
     def shallow_match_Name(self, ins_node, std_node, check_meta=True):
         """
         Matches ins_node to std_node for different cases of encountering a name node in ins_node
-            case 1: _var_ matches if std_node is a name node and automatically returns a mapping and symbol table
+            case 1: _var_ matches if std_node is a name node and automatically returns a mapping and symbol table;
+                    a type-constrained _var__type_ also needs the student variable to satisfy the constraint
             case 2: __exp__ matches to any subtree and automatically returns a mapping and symbol table
             case 3: ___ matches to any subtree and automatically returns a mapping
             case 4: matches only if the exact names are the same (falls through to shallow_match_generic)
         @return a mapping of ins_node to std_node and possibly a symbol_table, or False if it doesn't match
         """
-        name_id = ins_node.astNode.id
-        var_match = re.compile('^_[^_].*_$')  # /regex
-        exp_match = re.compile('^__.*__$')  # /regex
-        wild_card = re.compile('^___$')  # /regex
+        name_kind = self.get_name_kind(ins_node)
         mapping = AstMap()
         matched = False
         meta_matched = self.metas_match(ins_node, std_node, check_meta)
-        if var_match.match(name_id) and meta_matched:  # variable
+        if name_kind == VARIABLE and meta_matched:  # variable
             if type(std_node.astNode).__name__ == "Name":
-                mapping.add_var_to_sym_table(ins_node, std_node)  # TODO: Capture result?
+                constraint = self.get_type_constraint(ins_node)
+                if not constraint:
+                    mapping.add_var_to_sym_table(ins_node, std_node)  # TODO: Capture result?
+                elif self.satisfies_type(constraint, std_node):
+                    mapping.add_var_to_sym_table(constraint[0], std_node)
+                else:
+                    return False
                 matched = True
         # could else return False, but shallow_match_generic should do this as well
-        elif exp_match.match(name_id) and meta_matched:  # expression TODO: In theory this won't run?
+        elif name_kind == EXPRESSION and meta_matched:  # expression TODO: In theory this won't run?
             mapping.add_exp_to_sym_table(ins_node, std_node)
             matched = True
-        elif wild_card.match(name_id) and meta_matched:  # don't care TODO: In theory this won't run?
+        elif name_kind == WILDCARD and meta_matched:  # don't care TODO: In theory this won't run?
             matched = True
 
         if matched:
@@ -373,13 +820,15 @@ class StretchyTreeMatcher:
         :param check_meta: flag to check whether the fields of the instructor node and the student node should match
         :return: a mapping between the isntructor and student root nodes, or False if such a mapping doesn't exist
         """
+        # Nodes of different types are told apart by their type codes, before any of their fields are read
+        if ins_node.type_code != std_node.type_code:
+            return False
         ins = ins_node.astNode
         std = std_node.astNode
         ins_field_list = list(ast.iter_fields(ins))
         std_field_list = list(ast.iter_fields(std))
         meta_matched = self.metas_match(ins_node, std_node, check_meta)
-        is_match = len(ins_field_list) == len(std_field_list) and type(ins).__name__ == type(
-            std).__name__ and meta_matched
+        is_match = len(ins_field_list) == len(std_field_list) and meta_matched
         for insTup, stdTup in zip(ins_field_list, std_field_list):
             if not is_match:
                 break
@@ -3,6 +3,7 @@ from pedal.report.imperative import *
 
 
 def append_group_on_change():
+    use_incremental_matching()
     wrong_not_append_to_list()
 
 
@@ -39,8 +40,7 @@ def missing_append_in_iteration():
                            "    __expr__")
     if matches:
         for match in matches:
-            __expr__ = match.exp_table.get("__expr__")
-            submatch = find_expr_sub_matches("___.append(___)", __expr__, cut=True)
+            submatch = find_sub_matches(match, "__expr__", "___.append(___)", cut=True)
             if not submatch:
                 explain("You must construct a list by appending values one at a time to the list."
                         "<br><br><i>(app_in_iter)<i></br>")
@@ -53,8 +53,7 @@ def wrong_not_append_to_list():
                            "    __expr__")
     if matches:
         for match in matches:
-            __expr__ = match.exp_table.get("__expr__")
-            submatches = find_expr_sub_matches("_target_.append(___)", __expr__, cut=True)
+            submatches = find_sub_matches(match, "__expr__", "_target_.append(___)", cut=True)
             if submatches:
                 for submatch in submatches:
                     _target_ = submatch.symbol_table.get("_target_")[0].astNode
@@ -71,8 +70,7 @@ def missing_append_list_initialization():
                            "    __expr__")
     if matches:
         for match in matches:
-            __expr__ = match.exp_table.get("__expr__")
-            submatches = find_expr_sub_matches("_new_list_.append(___)", __expr__, cut=True)
+            submatches = find_sub_matches(match, "__expr__", "_new_list_.append(___)", cut=True)
             if submatches:
                 for submatch in submatches:
                     _new_list_ = submatch.symbol_table.get("_new_list_")[0].astNode
@@ -107,14 +105,12 @@ def wrong_append_list_initialization():
 
 
 def append_list_wrong_slot():
-    matches = find_matches("_target_.append(_item_)")
-    if matches:
-        for match in matches:
-            _item_ = match.symbol_table.get("_item_")[0].astNode
-            _target_ = match.symbol_table.get("_target_")[0].astNode
-            if data_type(_item_).is_instance(list):
-                explain("You should not append a list (<code>{0!s}</code>) to <code>{1!s}</code>.<br><br><i>"
-                        "(app_list_slot)<i></br>".format(_item_.id, _target_.id))
-                return True
+    match = find_match("_target_.append(_item__list_)")
+    if match:
+        _item_ = match.symbol_table.get("_item_")[0].astNode
+        _target_ = match.symbol_table.get("_target_")[0].astNode
+        explain("You should not append a list (<code>{0!s}</code>) to <code>{1!s}</code>.<br><br><i>"
+                "(app_list_slot)<i></br>".format(_item_.id, _target_.id))
+        return True
     return False
 
@@ -60,14 +60,13 @@ def histogram_argument_not_list():
 
     :return:
     """
-    matches = find_matches("plt.hist(_argument_)")
-    if matches:
-        for match in matches:
-            _argument_ = match.symbol_table.get("_argument_")[0].astNode
-            if not data_type(_argument_).is_instance(list):
-                explain("Making a histogram requires a list; <code>{0!s}</code> is not a list.<br><br><i>"
-                        "(hist_arg_not_list)<i></br>".format(_argument_.id))
-                return True
+    # Arguments that were never defined, or whose type is unknown, are not known to be lists either
+    match = find_match("plt.hist(_argument__unknown_or_not_list_)")
+    if match:
+        _argument_ = match.symbol_table.get("_argument_")[0].astNode
+        explain("Making a histogram requires a list; <code>{0!s}</code> is not a list.<br><br><i>"
+                "(hist_arg_not_list)<i></br>".format(_argument_.id))
+        return True
     return False
 
 
@@ -15,6 +15,7 @@ def iteration_group():
 
 
 def iteration_group_on_change():
+    use_incremental_matching()
     wrong_target_is_list()
     wrong_list_repeated_in_for()
     wrong_iterator_not_list()
@@ -3,6 +3,7 @@ A package for verifying source code.
 '''
 
 from pedal.report import MAIN_REPORT, Feedback
+from pedal.source.source_cache import SOURCE_CACHE
 import ast
 
 NAME = 'Source'
@@ -33,7 +34,7 @@ def _check_issues(code, report):
                       mistakes="Source code file is blank.")
         report['source']['success'] = False
     try:
-        parsed = ast.parse(code)
+        parsed = SOURCE_CACHE.parse(code)
         report['source']['ast'] = parsed
     except SyntaxError as e:
         report.attach('Syntax error', category=CATEGORY, tool=NAME,
@@ -0,0 +1,97 @@
+import ast
+import hashlib
+from collections import OrderedDict
+
+
+class SourceCache:
+    '''
+    A process-wide cache of the work done on source code, keyed by a hash of
+    the code's text. Identical submissions (unmodified starter code,
+    resubmissions) are parsed only once per process, and tools can store
+    whatever else they derive from the code in the same entry. The least
+    recently used entry is evicted once max_size entries are held.
+
+    Everything stored in an entry is shared by every Report that analyzes the
+    same code, so it must not be modified after being stored.
+
+    Attributes:
+        hits (int): The number of lookups that found an existing entry.
+        misses (int): The number of lookups that had to create an entry.
+    '''
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def hash_code(code):
+        '''
+        Args:
+            code (str): The source code
+        Returns:
+            str: The key that the code's entry is stored under.
+        '''
+        return hashlib.sha256(code.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def get(self, code):
+        '''
+        Retrieves the entry for the given code, creating an empty one if
+        necessary.
+
+        Args:
+            code (str): The source code
+        Returns:
+            dict: The entry, which maps names chosen by each tool to the
+                  results they cached for this code.
+        '''
+        key = self.hash_code(code)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        entry = {}
+        self._entries[key] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def parse(self, code, filename='<unknown>'):
+        '''
+        Parses the given code, reusing the AST from an earlier parse of the
+        same code. Code that fails to parse is not cached, so the error is
+        raised again by every call.
+
+        Args:
+            code (str): The source code
+            filename (str): The filename to report syntax errors with
+        Returns:
+            AST: The parsed code
+        '''
+        entry = self.get(code)
+        if 'ast' not in entry:
+            entry['ast'] = ast.parse(code, filename)
+        return entry['ast']
+
+    def clear(self):
+        '''
+        Empties the cache and resets the counters.
+        '''
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, code):
+        return self.hash_code(code) in self._entries
+
+
+SOURCE_CACHE = SourceCache()
@@ -25,9 +25,9 @@ Important concepts:
     Scope: The context of a function, with its own namespaces. Represented
            internally using numeric IDs (Scope IDs).
     Scope Chain: A stack of scopes, with the innermost scope on top.
-    Fully Qualified Name: A string representation of a variable and its scope
-                          chain, written using "/". For example:
-                          0/1/4/my_variable_name
+    Fully Qualified Name: A tuple of a variable's scope chain followed by its
+                          name, used to key the Name Map. For example:
+                          (4, 1, 0, 'my_variable_name')
     Path: A single path of execution through the control flow; every program
           has at least one sequential path, but IFs, FORs, WHILEs, etc. can
           cause multiple paths. Paths are represented using numeric IDs (Path
@@ -44,8 +44,11 @@ Important concepts:
     Name Map: (Path x Fully Qualified Names) => States
 '''
 
+import copy
+
 from pedal.tifa.tifa import Tifa
 from pedal.report import MAIN_REPORT
+from pedal.source.source_cache import SOURCE_CACHE
 
 NAME = 'TIFA'
 SHORT_DESCRIPTION = "Finds common issues caused by students."
@@ -62,8 +65,33 @@ def tifa_analysis(python_3=True, report=None):
     '''
     if report is None:
         report = MAIN_REPORT
-    t = Tifa(python_3=python_3, report=report)
-    t.process_code(report['source']['code'])
+    code = report['source']['code']
+    # Identical code always gets the same analysis, so it is only done once
+    entry = SOURCE_CACHE.get(code)
+    key = 'tifa' if python_3 else 'tifa_skulpt'
+    if key not in entry:
+        feedback_start = len(report.feedback)
+        t = Tifa(python_3=python_3, report=report)
+        t.process_code(code)
+        entry[key] = (_copy_results(report['tifa']),
+                      [copy.copy(f) for f in report.feedback[feedback_start:]])
+    else:
+        results, feedback = entry[key]
+        report['tifa'] = _copy_results(results)
+        report.feedback.extend(copy.copy(f) for f in feedback)
+    return report['tifa']
+
+def _copy_results(results):
+    '''
+    Copies the containers of a TIFA result that could be modified, so that
+    a Report does not share them with the cache. The States and Types inside
+    are shared.
+    '''
+    copied = dict(results)
+    copied['top_level_variables'] = dict(results['top_level_variables'])
+    copied['issues'] = {issue: list(instances)
+                        for issue, instances in results['issues'].items()}
+    return copied
 
 __all__ = ['NAME', 'DESCRIPTION', 'SHORT_DESCRIPTION',
            'REQUIRES', 'OPTIONALS',
@@ -0,0 +1,84 @@
+from pedal.tifa.type_operations import type_signature
+
+
+class FunctionSummary:
+    '''
+    A record of everything that analyzing one call of a function did outside
+    of the function's own scope, so that later calls with the same argument
+    types can replay it instead of walking the function's body again.
+
+    Args:
+        scope_id (int): The last scope ID that was created before the call;
+                        every scope created by the call has a greater ID.
+
+    Attributes:
+        issues (list of (str, dict)): The issues reported during the call,
+                                      with their data.
+        outer_checks (dict): Maps the fully qualified name of every variable
+                             from an enclosing scope that the call touched to
+                             its (type signature, set, read) before the call.
+                             The read flag is None if the variable was first
+                             loaded, since loading does not depend on it.
+        outer_loads (list of (tuple, dict)): The fully qualified names and
+                                           positions of the loads of variables
+                                           from enclosing scopes, in order.
+        calls (set): The definitions of the functions called, directly or not.
+        reusable (bool): Whether the call's outcome depended only on the
+                         things recorded here.
+        return_type (Type): The type returned by the call.
+        returned (tuple or None): Where the returned type came from, if it
+                                  was not created by the call:
+                                  ('argument', index) or ('outer', name).
+    '''
+    def __init__(self, scope_id):
+        self.scope_id = scope_id
+        self.issues = []
+        self.outer_checks = {}
+        self.outer_loads = []
+        self.calls = set()
+        self.reusable = True
+        self.return_type = None
+        self.returned = None
+
+    def is_outer(self, full_name):
+        '''
+        Determine if the fully qualified variable name lives outside of the
+        scopes created by the call.
+        '''
+        return all(scope <= self.scope_id for scope in full_name[:-1])
+
+    def record_outer(self, full_name, state, load, position=None):
+        '''
+        Record that the call touched a variable from an enclosing scope.
+
+        Args:
+            full_name (tuple): The fully qualified name of the variable
+            state (State): The variable's state before it was touched
+            load (bool): Whether it was loaded (or else stored over)
+            position (dict): The position of the load
+        '''
+        if not self.is_outer(full_name):
+            return
+        if full_name not in self.outer_checks:
+            read = None if load else state.read
+            self.outer_checks[full_name] = (type_signature(state.type),
+                                            state.set, read)
+        if load:
+            self.outer_loads.append((full_name, position))
+
+    def absorb(self, inner):
+        '''
+        Add everything recorded for a call made during this call.
+
+        Args:
+            inner (FunctionSummary): The summary of the inner call
+        '''
+        self.issues.extend(inner.issues)
+        for full_name, check in inner.outer_checks.items():
+            if self.is_outer(full_name):
+                self.outer_checks.setdefault(full_name, check)
+        self.outer_loads.extend((full_name, position)
+                                for full_name, position in inner.outer_loads
+                                if self.is_outer(full_name))
+        self.calls.update(inner.calls)
+        self.reusable = self.reusable and inner.reusable
@@ -12,8 +12,8 @@ class Identifier:
                          scope. Used to detect the presence of certain kinds
                          of errors where the user is using a variable from
                          a different scope.
-        scoped_name (str): The fully qualified name of the variable, including
-                           its scope chain.
+        scoped_name (tuple): The fully qualified name of the variable: its
+                             scope chain followed by its name.
         state (State): The current state of the variable.
     '''
     def __init__(self, exists, in_scope=False, scoped_name="UNKNOWN", state=""):
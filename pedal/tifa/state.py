@@ -1,10 +1,3 @@
-
-def check_trace(state):
-        past_types = [state.type]
-        for past_state in state.trace:
-            past_types.extend(check_trace(past_state))
-        return past_types
-
 class State:
     '''
     A representation of a variable at a particular point in time of the program.
@@ -29,12 +22,29 @@ class State:
                     diverging path, it is possible that it was "maybe" changed.
         over_position (dict): A Position indicating where the State was
                               previously set versus when it was overwritten.
-        
+        depth (int): The length of the longest chain of States in the trace.
+        past_types (dict): Maps each class of Type that this variable took on
+                           before this State (even if that part of the trace
+                           was forgotten) to one of those types. Shared
+                           between States, so it must not be modified.
+    
+    Class Attributes:
+        max_trace_depth (int): How many States a trace may chain together
+                               before the older ones are forgotten, so that
+                               variables changed in long programs do not keep
+                               their entire history alive.
     '''
+    max_trace_depth = 100
+    
     def __init__(self, name, trace, type, method, position, 
                  read='maybe', set='maybe', over='maybe', over_position=None):
         self.name = name
         self.trace = trace
+        self.depth = 0
+        self.past_types = {}
+        for past_state in trace:
+            self.depth = max(self.depth, past_state.depth + 1)
+            self._add_past_types(past_state.get_observed_types())
         self.type = type
         self.method = method
         self.position = position
@@ -46,9 +56,42 @@ class State:
     def copy(self, method, position):
         '''
         Make a copy of this State, copying this state into the new State's trace
+        (unless the trace is already as long as allowed, in which case the new
+        State starts a fresh trace but remembers the types seen so far)
+        '''
+        if self.depth < State.max_trace_depth:
+            return State(self.name, [self], self.type, method, position,
+                         self.read, self.set, self.over, self.over_position)
+        state = State(self.name, [], self.type, method, position,
+                      self.read, self.set, self.over, self.over_position)
+        state.past_types = self.get_observed_types()
+        return state
+    
+    def _add_past_types(self, past_types):
+        '''
+        Add to the types this variable took on before this State, copying the
+        dictionary only if it actually gains a type.
+        '''
+        if not self.past_types:
+            self.past_types = past_types
+        elif any(past_class not in self.past_types
+                 for past_class in past_types):
+            self.past_types = dict(self.past_types)
+            self.past_types.update(past_types)
+    
+    def get_observed_types(self):
+        '''
+        Retrieve the types this variable took on, up to and including this
+        State, with one type for each class of Type.
+        
+        Returns:
+            dict: Maps classes of Type to one of the types of that class.
         '''
-        return State(self.name, [self], self.type, method, position,
-                     self.read, self.set, self.over, self.over_position)
+        if type(self.type) in self.past_types:
+            return self.past_types
+        observed_types = dict(self.past_types)
+        observed_types[type(self.type)] = self.type
+        return observed_types
 
     def __str__(self):
         '''
@@ -69,9 +112,10 @@ class State:
     
     def was_type(self, a_type):
         '''
-        Retrieve all the types that this variable took on over its entire
+        Determine if this variable took on the given type at any point in its
         trace.
         '''
-        past_types = check_trace(self)
-        return any(past_type.is_equal(a_type) for past_type in past_types)
+        # Whether a type is equal only depends on its class
+        return any(past_type.is_equal(a_type)
+                   for past_type in self.get_observed_types().values())
     
\ No newline at end of file
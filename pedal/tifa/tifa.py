@@ -1,7 +1,9 @@
 import ast
+import copy
 from pprint import pprint
 
 from pedal.report import Report, Feedback, MAIN_REPORT
+from pedal.source.source_cache import SOURCE_CACHE
 
 from pedal.tifa.type_definitions import (UnknownType, RecursedType,
                                          FunctionType, ClassType, NumType,
@@ -15,10 +17,12 @@ from pedal.tifa.type_definitions import (UnknownType, RecursedType,
                                          LiteralTuple)
 from pedal.tifa.builtin_definitions import (get_builtin_module, get_builtin_function)
 from pedal.tifa.type_operations import (merge_types, are_types_equal,
+                                        type_signature,
                                         VALID_UNARYOP_TYPES, VALID_BINOP_TYPES,
                                         ORDERABLE_TYPES, INDEXABLE_TYPES)
 from pedal.tifa.identifier import Identifier    
 from pedal.tifa.state import State
+from pedal.tifa.function_summary import FunctionSummary
 from pedal.tifa.messages import _format_message
 
 __all__ = ['Tifa']
@@ -49,7 +53,8 @@ class Tifa(ast.NodeVisitor):
             'success': True,
             'variables': {},
             'top_level_variables': {},
-            'issues': {}
+            'issues': {},
+            'function_summaries': {'hits': 0, 'misses': 0}
         }
     
     def report_issue(self, issue, data=None):
@@ -65,6 +70,8 @@ class Tifa(ast.NodeVisitor):
         if issue not in self.report['tifa']['issues']:
             self.report['tifa']['issues'][issue] = []
         self.report['tifa']['issues'][issue].append(data)
+        if self.summary_stack:
+            self.summary_stack[-1].issues.append((issue, data))
         if data['message'] != False:
             self.report.attach(issue, category='Analyzer', tool='TIFA',
                                mistakes=data)
@@ -102,7 +109,7 @@ class Tifa(ast.NodeVisitor):
         
         # Attempt parsing - might fail!
         try:
-            ast_tree = ast.parse(code, filename)
+            ast_tree = SOURCE_CACHE.parse(code, filename)
         except Exception as error:
             self.report['tifa']['success'] = False
             self.report['tifa']['error'] = error
@@ -156,9 +163,8 @@ class Tifa(ast.NodeVisitor):
         top_level_variables = self.report['tifa']['top_level_variables']
         main_path_vars = self.name_map[self.path_chain[0]]
         for full_name in main_path_vars:
-            split_name = full_name.split("/")
-            if len(split_name) == 2 and split_name[0] == str(self.scope_chain[0]):
-                name = split_name[1]
+            if len(full_name) == 2 and full_name[0] == self.scope_chain[0]:
+                name = full_name[1]
                 top_level_variables[name] = main_path_vars[full_name]
     
     def _reset(self):
@@ -181,24 +187,32 @@ class Tifa(ast.NodeVisitor):
         self.name_map = {}
         self.name_map[self.path_id] = {}
         self.definition_chain = []
+        # Function calls that were already analyzed, and those being analyzed
+        self.function_summaries = {}
+        self.summary_stack = []
         self.path_parents = {}
         self.final_node = None
         
-    def find_variable_scope(self, name):
+    def find_variable_scope(self, name, scope_chain=None):
         '''
         Walk through this scope and all enclosing scopes, finding the relevant
         identifier given by `name`.
         
         Args:
             name (str): The name of the variable
+            scope_chain (list of int): The scope chain to search, if not the
+                                       current one.
         Returns:
             Identifier: An Identifier for the variable, which could potentially
                         not exist.
         '''
-        for scope_level, scope in enumerate(self.scope_chain):
+        if scope_chain is None:
+            scope_chain = self.scope_chain
+        scope_chain = tuple(scope_chain)
+        for scope_level, scope in enumerate(scope_chain):
+            full_name = scope_chain[scope_level:] + (name,)
             for path_id in self.path_chain:
                 path = self.name_map[path_id]
-                full_name = "/".join(map(str, self.scope_chain[scope_level:]))+"/"+name
                 if full_name in path:
                     is_root_scope = (scope_level==0)
                     return Identifier(True, is_root_scope, 
@@ -219,20 +233,30 @@ class Tifa(ast.NodeVisitor):
         '''
         for path in self.name_map.values():
             for full_name in path:
-                unscoped_name = full_name.split("/")[-1]
+                unscoped_name = full_name[-1]
                 if name == unscoped_name:
                     return Identifier(True, False, unscoped_name, path[full_name])
         return Identifier(False)
     
     def find_path_parent(self, path_id, name):
-        if name in self.name_map[path_id]:
-            return Identifier(True, state=self.name_map[path_id][name])
-        else:
-            path_parent = self.path_parents.get(path_id)
-            if path_parent is None:
-                return Identifier(False)
-            else:
-                return self.find_path_parent(path_parent, name)
+        '''
+        Find the state of a variable as seen from the given path: from the
+        path's own names if it changed the variable, or else from the nearest
+        path it branched off of that did.
+        
+        Args:
+            path_id (int): The path to start looking on
+            name (tuple): The fully qualified name of the variable
+        Returns:
+            Identifier: An Identifier for the variable, which could potentially
+                        not exist.
+        '''
+        while path_id is not None:
+            state = self.name_map[path_id].get(name)
+            if state is not None:
+                return Identifier(True, state=state)
+            path_id = self.path_parents.get(path_id)
+        return Identifier(False)
         
     def _finish_scope(self):
         '''
@@ -445,6 +469,8 @@ class Tifa(ast.NodeVisitor):
         if isinstance(function_type, FunctionType):
             # Test if we have called this definition before
             if function_type.definition not in self.definition_chain:
+                if self.summary_stack:
+                    self.summary_stack[-1].calls.add(function_type.definition)
                 self.definition_chain.append(function_type.definition)
                 # Function invocation
                 result = function_type.definition(self, function_type, callee, 
@@ -452,6 +478,9 @@ class Tifa(ast.NodeVisitor):
                 self.definition_chain.pop()
                 return result
             else:
+                # The outcome depends on the calls that led here
+                for summary in self.summary_stack:
+                    summary.reusable = False
                 self.report_issue("Recursive Call", {"name": callee})
         else:
             self.report_issue("Not a function", {"name": callee})
@@ -600,7 +629,9 @@ class Tifa(ast.NodeVisitor):
                     return_state = self.load_variable("*return", call_position)
                     return_value = return_state.type
             return return_value
-        function = FunctionType(definition=definition, name=function_name)
+        function = FunctionType(definition=self.summarize_calls(
+                                    definition, definitions_scope),
+                                name=function_name)
         self.store_variable(function_name, function)
         return function
     
@@ -695,7 +726,8 @@ class Tifa(ast.NodeVisitor):
                         self.store_variable(name, UnknownType(), position)
                 return_value = self.visit(node.body)
             return return_value
-        return FunctionType(definition=definition)
+        return FunctionType(definition=self.summarize_calls(definition,
+                                                            definitions_scope))
     
     def visit_List(self, node):
         type = ListType()
@@ -849,18 +881,18 @@ class Tifa(ast.NodeVisitor):
         # Handle the bodies
         self.visit_statements(node.body)
         
-    def _scope_chain_str(self, name=None):
+    def _scope_chain_key(self, name=None):
         '''
-        Convert the current scope chain to a string representation (divided 
-        by "/").
+        Convert the current scope chain to a tuple, optionally followed by a
+        variable's name to make that variable's fully qualified name.
         
         Returns:
-            str: String representation of the scope chain.
+            tuple: The scope chain (and name).
         '''
         if name:
-            return "/".join(map(str, self.scope_chain)) + "/" + name
+            return tuple(self.scope_chain) + (name,)
         else:
-            return "/".join(map(str, self.scope_chain))
+            return tuple(self.scope_chain)
         
     def identify_caller(self, node):
         '''
@@ -916,7 +948,7 @@ class Tifa(ast.NodeVisitor):
         '''
         if position is None:
             position = self.locate()
-        full_name = self._scope_chain_str(name)
+        full_name = self._scope_chain_key(name)
         current_path = self.path_chain[0]
         variable = self.find_variable_scope(name)
         if not variable.exists:
@@ -927,6 +959,9 @@ class Tifa(ast.NodeVisitor):
         else:
             new_state = self.trace_state(variable.state, "store", position)
             if not variable.in_scope:
+                if self.summary_stack:
+                    self.summary_stack[-1].record_outer(variable.scoped_name,
+                                                        variable.state, False)
                 self.report_issue("Write out of scope", {'name': name})
             # Type change?
             if not are_types_equal(type, variable.state.type):
@@ -956,12 +991,15 @@ class Tifa(ast.NodeVisitor):
         Returns:
             State: The current state of the variable.
         '''
-        full_name = self._scope_chain_str(name)
+        full_name = self._scope_chain_key(name)
         current_path = self.path_chain[0]
         variable = self.find_variable_scope(name)
         if position is None:
             position = self.locate()
         if not variable.exists:
+            # Which issue is reported depends on every scope analyzed so far
+            for summary in self.summary_stack:
+                summary.reusable = False
             out_of_scope_var = self.find_variable_out_of_scope(name)
             # Create a new instance of the variable on the current path
             if out_of_scope_var.exists:
@@ -979,6 +1017,10 @@ class Tifa(ast.NodeVisitor):
                 self.report_issue("Possible Initialization Problem", {'name': name})
             new_state.read = 'yes';
             if not variable.in_scope:
+                if self.summary_stack:
+                    self.summary_stack[-1].record_outer(variable.scoped_name,
+                                                        variable.state, True,
+                                                        position)
                 self.name_map[current_path][variable.scoped_name] = new_state
             else:
                 self.name_map[current_path][full_name] = new_state
@@ -1017,7 +1059,8 @@ class Tifa(ast.NodeVisitor):
                 return ModuleType()
             
     def combine_states(self, left, right):
-        state = State(left.name, [left], left.type, 'branch', self.locate(),
+        trace = [left] if right is None else [left, right]
+        state = State(left.name, trace, left.type, 'branch', self.locate(),
                       read=left.read, set=left.set, over=left.over,
                       over_position=left.over_position)
         if right is None:
@@ -1034,7 +1077,6 @@ class Tifa(ast.NodeVisitor):
             state.over = Tifa.match_rso(left.over, right.over)
             if left.over == 'no':
                 state.over_position = right.over_position
-            state.trace.append(right)
         return state
     
     def merge_paths(self, parent_path_id, left_path_id, right_path_id):
@@ -1047,27 +1089,29 @@ class Tifa(ast.NodeVisitor):
             left_path_id (int): One of the two paths
             right_path_id (int): The other of the two paths.
         '''
-        # Combine two paths into one
+        # Each path only holds the names that were changed on it, so only
+        # those names need to be combined; the rest stay as the parent has them
+        parent_names = self.name_map[parent_path_id]
+        left_names = self.name_map[left_path_id]
+        right_names = self.name_map[right_path_id]
         # Check for any names that are on the IF path
-        for left_name in self.name_map[left_path_id]:
-            left_state = self.name_map[left_path_id][left_name]
-            right_identifier = self.find_path_parent(right_path_id, left_name)
-            if right_identifier.exists:
-                # Was on both IF and ELSE path
-                right_state = right_identifier.state
-            else:
-                # Was only on IF path, potentially on the parent path
-                right_state = self.name_map[parent_path_id].get(left_name)
-            combined = self.combine_states(left_state, right_state)
-            self.name_map[parent_path_id][left_name] = combined
+        for left_name, left_state in left_names.items():
+            right_state = right_names.get(left_name)
+            if right_state is None:
+                # Was only on IF path, but potentially set before the branch
+                right_identifier = self.find_path_parent(
+                    self.path_parents.get(right_path_id), left_name)
+                if right_identifier.exists:
+                    right_state = right_identifier.state
+            parent_names[left_name] = self.combine_states(left_state,
+                                                          right_state)
         # Check for names that are on the ELSE path but not the IF path
-        for right_name in self.name_map[right_path_id]:
-            if right_name not in self.name_map[left_path_id]:
-                right_state = self.name_map[right_path_id][right_name]
+        for right_name, right_state in right_names.items():
+            if right_name not in left_names:
                 # Potentially on the parent path
-                parent_state = self.name_map[parent_path_id].get(right_name)
-                combined = self.combine_states(right_state, parent_state)
-                self.name_map[parent_path_id][right_name] = combined
+                parent_state = parent_names.get(right_name)
+                parent_names[right_name] = self.combine_states(right_state,
+                                                               parent_state)
     
     def trace_state(self, state, method, position):
         '''
@@ -1081,6 +1125,124 @@ class Tifa(ast.NodeVisitor):
         '''
         return state.copy(method, position)
     
+    def summarize_calls(self, definition, definitions_scope):
+        '''
+        Wrap the definition of a user's function so that each call is only
+        analyzed once for every combination of argument types. The first such
+        call records a FunctionSummary; later calls replay its issues and its
+        loads of outer variables, as long as the outer variables it depended
+        on still look the same.
+        
+        Args:
+            definition (function): The definition to wrap
+            definitions_scope (list of int): The scope chain of the definition
+        Returns:
+            function: The wrapped definition
+        '''
+        def summarized_definition(tifa, call_type, call_name, parameters,
+                                  call_position):
+            counts = self.report['tifa']['function_summaries']
+            key = (definition, type_signature(parameters))
+            summary = self.function_summaries.get(key)
+            if (summary is not None and 
+                    self._is_summary_current(summary, definitions_scope)):
+                counts['hits'] += 1
+                return self._replay_summary(summary, parameters)
+            counts['misses'] += 1
+            summary = FunctionSummary(self.scope_id)
+            signatures = [type_signature(p) for p in parameters]
+            self.summary_stack.append(summary)
+            try:
+                return_type = definition(tifa, call_type, call_name,
+                                         parameters, call_position)
+            finally:
+                self.summary_stack.pop()
+                if self.summary_stack:
+                    self.summary_stack[-1].absorb(summary)
+            # Calls that changed their arguments or outer variables in place
+            # cannot be replayed
+            changed = signatures != [type_signature(p) for p in parameters]
+            for full_name, check in summary.outer_checks.items():
+                state = self._find_state(full_name)
+                if state is None or type_signature(state.type) != check[0]:
+                    changed = True
+            if summary.reusable and not changed:
+                # Callers may change the returned type in place (e.g., by
+                # appending to it), so the summary keeps its own copy
+                summary.return_type = copy.copy(return_type)
+                summary.returned = self._find_type_origin(return_type,
+                                                          parameters, summary)
+                self.function_summaries[key] = summary
+            return return_type
+        return summarized_definition
+    
+    def _is_summary_current(self, summary, definitions_scope):
+        '''
+        Determine if replaying the summary would have the same outcome as
+        analyzing the call again.
+        '''
+        if any(called in self.definition_chain for called in summary.calls):
+            return False
+        for full_name, check in summary.outer_checks.items():
+            name = full_name[-1]
+            variable = self.find_variable_scope(name, definitions_scope)
+            if not variable.exists or variable.scoped_name != full_name:
+                return False
+            signature, was_set, was_read = check
+            state = variable.state
+            if type_signature(state.type) != signature:
+                return False
+            if state.set != was_set:
+                return False
+            if was_read is not None and state.read != was_read:
+                return False
+        return True
+    
+    def _replay_summary(self, summary, parameters):
+        '''
+        Apply the recorded effects of a call again, returning its type.
+        '''
+        for full_name, position in summary.outer_loads:
+            state = self._find_state(full_name)
+            new_state = self.trace_state(state, "load", position)
+            new_state.read = 'yes'
+            self.name_map[self.path_chain[0]][full_name] = new_state
+            if self.summary_stack:
+                self.summary_stack[-1].record_outer(full_name, state, True,
+                                                    position)
+        for issue, data in summary.issues:
+            self.report_issue(issue, dict(data))
+        if summary.returned is None:
+            return copy.copy(summary.return_type)
+        kind, origin = summary.returned
+        if kind == 'argument':
+            return parameters[origin]
+        return self._find_state(origin).type
+    
+    def _find_type_origin(self, a_type, parameters, summary):
+        '''
+        Find the argument or outer variable that a returned type is shared
+        with, so that replayed calls return the same object.
+        '''
+        for index, parameter in enumerate(parameters):
+            if parameter is a_type:
+                return ('argument', index)
+        for full_name in summary.outer_checks:
+            state = self._find_state(full_name)
+            if state is not None and state.type is a_type:
+                return ('outer', full_name)
+        return None
+    
+    def _find_state(self, full_name):
+        '''
+        Find the current state of a fully qualified variable name on the
+        current path.
+        '''
+        for path_id in self.path_chain:
+            if full_name in self.name_map[path_id]:
+                return self.name_map[path_id][full_name]
+        return None
+    
     @staticmethod
     def in_scope(full_name, scope_chain):
         '''
@@ -1088,15 +1250,15 @@ class Tifa(ast.NodeVisitor):
         chain.
         
         Args:
-            full_name (str): A fully qualified variable name
+            full_name (tuple): A fully qualified variable name
             scope_chain (list): A representation of a scope chain.
         Returns:
             bool: Whether the variable lives in this scope
         '''
         # Get this entity's full scope chain
-        name_scopes = full_name.split("/")[:-1]
+        name_scopes = full_name[:-1]
         # against the reverse scope chain
-        checking_scopes = [str(s) for s in scope_chain[::-1]]
+        checking_scopes = tuple(scope_chain[::-1])
         return name_scopes == checking_scopes
     
     @staticmethod
@@ -1133,7 +1295,9 @@ class Tifa(ast.NodeVisitor):
     class NewPath:
         '''
         Context manager for entering and leaving execution paths (e.g., if
-        statements).)
+        statements).) A path starts with no names of its own: it only holds
+        the states of the variables changed on it, and looks up everything
+        else on the path it branched off of (see find_path_parent).
         
         Args:
             tifa (Tifa): The tifa instance, so we can modify some of its
@@ -115,8 +115,35 @@ class Type:
         # TODO: Implement this correctly
         return self.is_equal(other)
     
+class InternedType(Type):
+    '''
+    Parent class for types that have no parts that could change. Creating
+    one of these types returns a shared instance, so the analysis does not
+    allocate a new type for every expression, and these types can be
+    compared by identity.
+    
+    Subclasses whose constructor takes arguments must override __new__ and
+    __reduce__ to pass them along.
+    '''
+    _instances = {}
+    immutable = True
+    def __new__(cls, *args):
+        key = (cls,) + args
+        if key not in InternedType._instances:
+            InternedType._instances[key] = Type.__new__(cls)
+        return InternedType._instances[key]
+    def clone(self):
+        # Like any other type, a clone starts over from the default
+        # arguments (e.g., an empty string clones into a non-empty one)
+        return self.__class__()
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+    def __reduce__(self):
+        return (self.__class__, ())
 
-class UnknownType(Type):
+class UnknownType(InternedType):
     '''
     A special type used to indicate an unknowable type.
     '''
@@ -163,19 +190,16 @@ class ClassType(Type):
     def __init__(self, name):
         self.name = name
         
-class NumType(Type):
+class NumType(InternedType):
     singular_name = 'a number'
-    immutable = True
     def index(self, i):
         return UnknownType()
     
-class NoneType(Type):
+class NoneType(InternedType):
     singular_name = 'a None'
-    immutable = True
     
-class BoolType(Type):
+class BoolType(InternedType):
     singular_name = 'a boolean'
-    immutable = True
 
 class TupleType(Type):
     '''
@@ -220,16 +244,19 @@ class ListType(Type):
     def is_empty(self):
         return self.empty
 
-class StrType(Type):
+class StrType(InternedType):
     singular_name = 'a string'
+    def __new__(cls, empty=False):
+        return InternedType.__new__(cls, empty)
     def __init__(self, empty=False):
         self.empty = empty
+    def __reduce__(self):
+        return (self.__class__, (self.empty,))
     def index(self, i):
         return StrType()
     def is_empty(self):
         return self.empty
     fields = _dict_extends(Type.fields, {})
-    immutable = True
 
 StrType.fields.update({
     # Methods that return strings
@@ -3,7 +3,8 @@ import ast
 from pedal.tifa.type_definitions import (UnknownType, NumType, BoolType,
                                          TupleType, ListType, StrType,
                                          DictType, SetType, GeneratorType,
-                                         DayType, TimeType)
+                                         DayType, TimeType, ModuleType,
+                                         LiteralValue, Type, InternedType)
 
 
 def merge_types(left, right):
@@ -90,6 +91,9 @@ def are_types_equal(left, right):
         return False
     elif isinstance(left, UnknownType) or isinstance(right, UnknownType):
         return False
+    elif isinstance(left, InternedType):
+        # Checking identity first settles most comparisons of interned types
+        return left is right or type(left) is type(right)
     elif type(left) is not type(right):
         return False
     elif isinstance(left, (GeneratorType, ListType)):
@@ -131,6 +135,40 @@ def are_types_equal(left, right):
         return True
 
 
+def type_signature(value, _visiting=None):
+    '''
+    Summarize a type as a hashable value. Two types with the same signature
+    are treated identically by the analysis, so the signature can key caches
+    of analysis results and reveal whether a type was changed in place.
+    Modules are never changed by the analysis, and interned types cannot be,
+    so they stand for themselves.
+
+    Args:
+        value (Type): The type to summarize (or one of its fields)
+    Returns:
+        tuple: The signature of the type
+    '''
+    if isinstance(value, (ModuleType, InternedType)):
+        return value
+    elif isinstance(value, (Type, LiteralValue)):
+        if _visiting is None:
+            _visiting = set()
+        if id(value) in _visiting:
+            # A list that contains itself
+            return ('*cycle', type(value).__name__)
+        _visiting.add(id(value))
+        fields = tuple((name, type_signature(field, _visiting))
+                       for name, field in sorted(vars(value).items()))
+        _visiting.discard(id(value))
+        return (type(value).__name__,) + fields
+    elif isinstance(value, (list, tuple)):
+        return tuple(type_signature(item, _visiting) for item in value)
+    elif isinstance(value, dict):
+        return tuple((key, type_signature(item, _visiting))
+                     for key, item in sorted(value.items()))
+    return value
+
+
 ORDERABLE_TYPES = (NumType, BoolType, StrType, ListType, DayType, TimeType,
                    SetType, TupleType)
 INDEXABLE_TYPES = (StrType, ListType, SetType, TupleType, DictType)
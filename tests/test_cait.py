@@ -1,6 +1,9 @@
 from __future__ import print_function
 import unittest
 import ast
+import json
+import pickle
+import tempfile
 import sys
 import os
 
@@ -12,6 +15,11 @@ from pedal.source import set_source
 from pedal.tifa import tifa_analysis
 from pedal.report import MAIN_REPORT, clear_report
 from pedal.cait.cait_api import *
+from pedal.cait.pattern_cache import PatternCache
+from pedal.cait.ct_map import CtMap
+from pedal.cait.multi_pattern_matcher import MultiPatternMatcher
+from pedal.cait.incremental import IncrementalMatcher
+from pedal.cait.pattern_bundle import find_pattern_keys, save_bundle, load_bundle, compile_pattern, get_grammar_stamp
 
 '''
 _accu_ = 0
@@ -403,6 +411,21 @@ class CaitTests(unittest.TestCase):
         set_source("fun = 1 + 0")
         parse_program()
         self.assertTrue('cait' in MAIN_REPORT, "No parsing happened")
+
+        clear_report()
+        set_source("print(undefined)")
+        parse_program()
+        self.assertFalse('tifa' in MAIN_REPORT, "Parsing should not run TIFA")
+        self.assertEqual(MAIN_REPORT.feedback, [])
+        self.assertTrue(def_use_error("undefined"), "Other cait functions should still run TIFA")
+
+    def test_std_code(self):
+        clear_report()
+        set_source("a = 0")
+        matches = find_matches("_var_ = __expr__", std_code="first = 1\nsecond = 2")
+        self.assertEqual(len(matches), 2, "std_code was not searched")
+        self.assertTrue(find_match("print(___)", std_code="print(1)"))
+        self.assertEqual(MAIN_REPORT['source']['code'], "a = 0", "std_code replaced the main report's source")
     
     '''
     def test_def_use_error(self):
@@ -526,3 +549,367 @@ class CaitTests(unittest.TestCase):
 
         matches01 = matcher1.find_matches(student_code1, cut=True)
         self.assertTrue(matches01, "Cutting doesn't work")
+
+    def test_pattern_cache(self):
+        cache = PatternCache(max_size=2)
+        matcher = cache.get("_var_ = __expr__")
+        self.assertIs(cache.get("_var_ = __expr__"), matcher, "Compiled pattern was not reused")
+        self.assertIsNot(cache.get("_var_ = __expr__", cut=True), matcher, "Cut patterns should be cached separately")
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 2})
+        cache.get("print(___)")
+        self.assertFalse(("_var_ = __expr__", False) in cache, "Least recently used pattern was not evicted")
+
+        set_source("fun = 1 + 1\nfun2 = 2 + 2")
+        parse_program()
+        PATTERN_CACHE.clear()
+        find_matches("_var_ = __expr__")
+        matches = find_matches("_var_ = __expr__")
+        self.assertEqual(len(matches), 2, "Cached pattern does not match the same code")
+        self.assertEqual(PATTERN_CACHE.hits, 1)
+
+    def test_match_cache(self):
+        set_source("for item in items:\n    total = total + item")
+        parse_program()
+        matches = find_matches("for ___ in ___:\n    pass")
+        mapping_count = MAIN_REPORT['cait']['mapping_count']
+        matches2 = find_matches("for ___ in ___:\n    pass")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(MAIN_REPORT['cait']['mapping_count'], mapping_count, "Match results were not reused")
+        self.assertIs(matches[0].match_root, matches2[0].match_root)
+        self.assertIsNot(matches[0], matches2[0], "Cached matches should not be shared between callers")
+        match = find_match("for ___ in ___:\n    pass")
+        self.assertIs(match.match_root, matches[0].match_root)
+        self.assertEqual(MAIN_REPORT['cait']['mapping_count'], mapping_count)
+        match.add_var_to_sym_table("_item_", match.match_root.find_all("Name")[0])
+        match.get_std_name("_item_").append(None)
+        match.mappings.clear()
+        match.match_lineno = -1
+        again = find_match("for ___ in ___:\n    pass")
+        self.assertIsNone(again.get_std_name("_item_"), "Changing a match changed the cached results")
+        self.assertEqual(again.mappings.size(), matches[0].mappings.size())
+        self.assertEqual(again.match_lineno, 1)
+
+        set_source("for item in items:\n    pass\nfor item in items:\n    pass")
+        matches3 = find_matches("for ___ in ___:\n    pass")
+        self.assertEqual(len(matches3), 2, "Match cache was not invalidated by set_source")
+
+        set_source("for item in items:\n    pass\nfor item in")
+        self.assertFalse(MAIN_REPORT['source']['success'])
+        self.assertFalse(find_matches("for ___ in ___:\n    pass"), "Matched the code from before the syntax error")
+        self.assertEqual(len(parse_program().children), 0)
+        set_source("for item in items:\n    pass")
+        self.assertEqual(len(find_matches("for ___ in ___:\n    pass")), 1)
+        self.assertEqual(len(parse_program().children), 1)
+
+    def test_shared_ast(self):
+        set_source("for item in items:\n    print(item)")
+        std_ast = parse_program()
+        # Another tree over the same (cached) ast must not take over the nodes of the report's tree
+        EasyNode(MAIN_REPORT['source']['ast'])
+        loop = std_ast.find_all("For")[0]
+        self.assertIs(loop.iter.linear_tree, std_ast.linear_tree)
+        self.assertTrue(loop.is_ancestor(loop.iter))
+        self.assertIs(std_ast.body[0], loop)
+        self.assertFalse(hasattr(MAIN_REPORT['source']['ast'], 'easy_node'))
+
+    def test_name_classification(self):
+        matcher = StretchyTreeMatcher("_accu_ = __exp__ + ___ + total")
+        kinds = {name.id: name.name_kind for name in matcher.rootNode.find_all("Name")}
+        self.assertEqual(kinds, {"_accu_": VARIABLE, "__exp__": EXPRESSION, "___": WILDCARD, "total": LITERAL})
+        self.assertTrue(matcher.find_matches("result = 5 + 3 + total"))
+        self.assertFalse(matcher.find_matches("result = 5 + 3 + other"))
+
+    def test_layered_maps(self):
+        base = CtMap()
+        base.set("a", 1)
+        base.set("b", 2)
+        layer = CtMap(base)
+        layer.set("c", 3)
+        layer.set("a", 4)
+        layer.delete("b")
+        self.assertEqual(layer.keys, ["a", "c"], "Layered map lost the order of its keys")
+        self.assertEqual(layer.values, [4, 3])
+        self.assertFalse(layer.has("b"))
+        self.assertEqual(base.items(), [("a", 1), ("b", 2)], "Layering modified the parent map")
+        top = CtMap(layer)
+        top.set("b", 5)
+        self.assertEqual(top.items(), [("a", 4), ("c", 3), ("b", 5)], "Deleted key was not moved to the end")
+
+        upper = CtMap(base)
+        upper.set("c", 3)
+        upper.set("a", 4)
+        upper = CtMap(upper)
+        upper.set("b", 5)
+        upper.set("d", 6)
+        self.assertEqual(list(upper.iter_items()), list(upper.to_dict().items()))
+        upper.to_dict = None  # Reading part of the map should not copy it
+        self.assertEqual(next(upper.iter_items()), ("a", 4))
+
+        deep = base
+        for i in range(CtMap.MAX_DEPTH * 2):
+            deep = CtMap(deep)
+            deep.set(i, i)
+        self.assertTrue(deep.depth <= CtMap.MAX_DEPTH, "Chain of layers was never flattened")
+        self.assertEqual(deep.size(), 2 + CtMap.MAX_DEPTH * 2)
+
+        matcher = StretchyTreeMatcher("_a_ = 0\n_b_ = 1")
+        matches = matcher.find_matches("x = 0\ny = 1")
+        self.assertEqual(matches[0].symbol_table.get("_a_")[0].id, "x")
+        self.assertEqual(matches[0].symbol_table.get("_b_")[0].id, "y")
+
+    def test_prefilter(self):
+        matcher = StretchyTreeMatcher("for _item_ in my_list:\n    total = total + _item_")
+        summary = matcher.summarize(matcher.rootNode)
+        self.assertEqual(summary['types']['For'], 1)
+        self.assertEqual(summary['names'], {'my_list', 'total'})
+        student = parse_code("x = 0\nfor item in my_list:\n    total = total + item")
+        self.assertFalse(matcher.may_contain(summary, student.children[0]), "Assignment cannot contain a loop")
+        self.assertTrue(matcher.may_contain(summary, student))
+        loop_summary = matcher.summarize(matcher.rootNode.children[0])
+        self.assertTrue(matcher.may_contain(loop_summary, student.children[1]))
+        self.assertTrue(matcher.find_matches(student))
+        self.assertFalse(matcher.find_matches("for item in other_list:\n    total = total + item"))
+
+    def test_find_matches_many(self):
+        patterns = ["_var_ = __expr__", "for _item_ in ___:\n    __expr__", "_var_.append(___)", "while ___:\n    pass"]
+        student = "items = []\nfor item in [1, 2]:\n    items.append(item)\nitems = items"
+        std_ast = parse_code(student)
+        results = MultiPatternMatcher(patterns).find_matches(std_ast)
+        for pattern, matches in zip(patterns, results):
+            expected = StretchyTreeMatcher(pattern).find_matches(std_ast)
+            if not expected:
+                self.assertFalse(matches)
+                continue
+            self.assertEqual(len(matches), len(expected))
+            for match, expected_match in zip(matches, expected):
+                self.assertIs(match.match_root, expected_match.match_root)
+                self.assertEqual(match.match_lineno, expected_match.match_lineno)
+
+        set_source(student)
+        parse_program()
+        many = find_matches_many(patterns)
+        self.assertEqual(len(many[0]), 2)
+        self.assertFalse(many[3])
+        mapping_count = MAIN_REPORT['cait']['mapping_count']
+        self.assertIs(find_matches(patterns[0])[0].match_root, many[0][0].match_root)
+        self.assertEqual(MAIN_REPORT['cait']['mapping_count'], mapping_count, "Shared walk did not fill the match cache")
+
+    def test_iter_matches(self):
+        matcher = StretchyTreeMatcher("_var_ = __expr__")
+        std_ast = parse_code("a = 1\nif a:\n    b = 2\nc = 3")
+        matches = matcher.iter_matches(std_ast)
+        first = next(matches)
+        self.assertEqual(first.match_lineno, 1)
+        remaining = [match.match_lineno for match in matches]
+        self.assertEqual(remaining, [match.match_lineno for match in matcher.find_matches(std_ast)][1:])
+        self.assertEqual(sorted(remaining), [3, 4])
+        self.assertIsNone(next(StretchyTreeMatcher("while ___:\n    pass").iter_matches(std_ast), None))
+
+        set_source("a = 1\nb = 2")
+        parse_program()
+        self.assertEqual(find_match("_var_ = __expr__").match_lineno, 1)
+        self.assertIsNone(find_match("while ___:\n    pass"))
+
+    def test_bounded_mappings(self):
+        pattern = "for ___ in ___:\n    ___\n    ___"
+        student = "for item in items:\n" + "".join("    print({})\n".format(i) for i in range(12))
+        std_ast = parse_code(student)
+        unbounded = StretchyTreeMatcher(pattern, max_mappings=None, deduplicate=False).find_matches(std_ast)
+        matcher = StretchyTreeMatcher(pattern)
+        matches = matcher.find_matches(std_ast)
+        self.assertLess(len(matches), len(unbounded))
+        self.assertEqual(set(match.get_bindings_key() for match in matches),
+                         set(match.get_bindings_key() for match in unbounded))
+        self.assertIs(matches[0].mappings.values[-1].astNode, unbounded[0].mappings.values[-1].astNode)
+
+        capped = StretchyTreeMatcher(pattern, max_mappings=5, deduplicate=False)
+        self.assertEqual(len(capped.find_matches(std_ast)), 5)
+        self.assertGreater(capped.truncation_count, 0)
+
+        set_source(student)
+        parse_program()
+        find_matches(pattern)
+        self.assertGreater(MAIN_REPORT['cait']['mapping_count'], 0)
+        self.assertNotIn('mappings_truncated', MAIN_REPORT['cait'])
+
+    def test_incremental_matching(self):
+        pattern = "for _item_ in ___:\n    _sum_ = _sum_ + _item_"
+        before = "total = 0\nfor item in items:\n    total = total + item\nprint(total)"
+        after = "total = 0\nprint(items)\nfor item in items:\n    total = total + item\nprint(total + 1)"
+        incremental = IncrementalMatcher()
+        matcher = StretchyTreeMatcher(pattern)
+        old_ast = parse_code(before)
+        incremental.start(old_ast)
+        incremental.find_matches(matcher, old_ast)
+        new_ast = parse_code(after)
+        incremental.start(new_ast)
+        self.assertEqual(incremental.current.origins, [0, None, 1, None])
+        matches = incremental.find_matches(matcher, new_ast)
+        expected = matcher.find_matches(new_ast)
+        self.assertEqual(len(matches), len(expected))
+        for match, expected_match in zip(matches, expected):
+            self.assertIs(match.match_root, expected_match.match_root)
+            self.assertEqual(match.match_lineno, 3)
+            self.assertIs(match.get_std_name("_sum_")[0].astNode, expected_match.get_std_name("_sum_")[0].astNode)
+
+        clear_report()
+        set_source(after)
+        parse_program()
+        use_incremental_matching(incremental)
+        self.assertEqual(len(find_matches(pattern)), 1)
+        self.assertEqual(find_match(pattern).match_lineno, 3)
+
+        clear_report()
+        set_source(before)
+        use_incremental_matching()
+        find_matches(pattern)
+        on_change = MAIN_REPORT['cait']['on_change']
+        set_source(after)
+        use_incremental_matching()
+        self.assertIs(MAIN_REPORT['cait']['on_change'], on_change, "The previous submission was forgotten")
+        self.assertEqual(on_change.current.origins, [0, None, 1, None])
+        self.assertEqual(find_match(pattern).match_lineno, 3)
+        other_report = Report()
+        set_source(after, report=other_report)
+        use_incremental_matching(report=other_report)
+        self.assertIsNot(other_report['cait']['on_change'], on_change, "Reports should not share submissions")
+        clear_report()
+        set_source(after)
+        use_incremental_matching()
+        self.assertIsNone(MAIN_REPORT['cait']['on_change'].previous, "clear_report kept the previous submission")
+
+    def test_profile_matching(self):
+        pattern = "for _item_ in ___:\n    _sum_ = _sum_ + _item_"
+        clear_report()
+        set_source("total = 0\nfor item in items:\n    total = total + item\nfor x in items:\n    print(x)")
+        parse_program()
+        matcher = PATTERN_CACHE.get(pattern)
+        profile = profile_matching()
+        self.assertEqual(len(find_matches(pattern)), 1)
+        self.assertNotIn('deep_find_match', matcher.__dict__, "Matcher was left instrumented")
+        stats = profile.patterns[pattern]
+        self.assertEqual(stats['searches'], 1)
+        self.assertEqual(stats['matches'], 1)
+        self.assertGreater(stats['deep_find_match_calls'], 0)
+        self.assertGreater(stats['shallow_match_calls'], 0)
+        self.assertGreaterEqual(stats['mappings_created'], stats['mappings_discarded'])
+        self.assertEqual(json.loads(profile.to_json())[pattern]['matches'], 1)
+        label = pattern.replace("\n", "\\n")
+        stacks = [line.rsplit(" ", 1)[0] for line in profile.to_folded().splitlines()]
+        self.assertIn(label + ";Module;For", stacks)
+        self.assertTrue(all(stack.startswith(label + ";") for stack in stacks))
+
+    def test_type_constrained_variables(self):
+        self.assertEqual(parse_type_constraint("_items__list_"), ("_items_", "list", False, False))
+        self.assertEqual(parse_type_constraint("_items__not_str_"), ("_items_", "str", True, False))
+        self.assertEqual(parse_type_constraint("_items__unknown_or_not_list_"), ("_items_", "list", True, True))
+        self.assertFalse(parse_type_constraint("_my_list_"))
+        self.assertFalse(parse_type_constraint("_items__things_"))
+
+        clear_report()
+        set_source("items = [1, 2]\ncount = 0\nprint(items)\nprint(count)\nprint(missing)")
+        parse_program()
+        lists = find_matches("print(_value__list_)")
+        self.assertEqual(len(lists), 1)
+        self.assertEqual(lists[0].symbol_table.get("_value_")[0].astNode.id, "items")
+        others = find_matches("print(_value__not_list_)")
+        self.assertEqual(len(others), 1)
+        self.assertEqual(others[0].symbol_table.get("_value_")[0].astNode.id, "count")
+        self.assertFalse(find_matches("print(_value__str_)"))
+        self.assertEqual(len(find_matches("print(_value_)")), 3)
+        unknowns = find_matches("print(_value__unknown_or_not_list_)")
+        self.assertEqual([match.symbol_table.get("_value_")[0].astNode.id for match in unknowns], ["count", "missing"])
+
+        # Trees other than the report's get their variable types from their own analysis
+        others = find_expr_sub_matches("print(_value__not_list_)", "items = [1, 2]\nprint(items)\nprint(count)\n"
+                                                                   "count = 'a'\nprint(count)")
+        self.assertEqual(len(others), 2)
+        self.assertEqual(others[0].symbol_table.get("_value_")[0].astNode.id, "count")
+        std_ast = StretchyTreeMatcher.as_easy_node("items = [1, 2]\nprint(items)")
+        self.assertEqual(len(find_expr_sub_matches("print(_value__list_)", std_ast.children[1])), 1)
+        # The matcher itself never analyzes code, so a tree without types cannot be searched for constrained patterns
+        self.assertRaises(ValueError, StretchyTreeMatcher("print(_value__list_)").find_matches, "print(items)")
+
+    def test_find_sub_matches(self):
+        clear_report()
+        set_source("total = 0\nfor item in items:\n    print(total - item)\nprint(total)")
+        parse_program()
+        match = find_match("for ___ in ___:\n    __expr__")
+        sub_matches = find_sub_matches(match, "__expr__", "print(___)")
+        self.assertEqual(len(sub_matches), 1)
+        self.assertEqual(sub_matches[0].match_lineno, 3)
+        self.assertIs(PATTERN_CACHE.get_sub("print(___)"), PATTERN_CACHE.get_sub("print(___)"))
+        mapping_count = MAIN_REPORT['cait']['mapping_count']
+        self.assertIs(find_sub_matches(match, "__expr__", "print(___)")[0].match_root, sub_matches[0].match_root)
+        self.assertEqual(MAIN_REPORT['cait']['mapping_count'], mapping_count, "Sub-pattern search was not cached")
+        self.assertEqual(len(find_sub_matches(match, "__expr__", "_total_ - _item_")), 1)
+        self.assertFalse(find_sub_matches(match, "__expr__", "_sum_ = ___", as_expr=False))
+        self.assertFalse(find_sub_matches(match, "__other__", "print(___)"))
+        self.assertRaises(ValueError, find_sub_matches, match, "__expr__", "a = 0\nb = 0")
+
+        std_ast = StretchyTreeMatcher.as_easy_node("for item in items:\n    miles = item * 0.62")
+        results = []
+        for order in ((False, True), (True, False)):
+            PATTERN_CACHE.clear()
+            matcher = PATTERN_CACHE.get_sub("_item_*0.62")
+            fields = [ins_node.field for ins_node in matcher.rootNode.linear_tree]
+            found = {cut: len(find_expr_sub_matches("_item_*0.62", std_ast, cut=cut) or []) for cut in order}
+            self.assertEqual([ins_node.field for ins_node in matcher.rootNode.linear_tree], fields,
+                             "Searching with cut changed the cached sub-pattern")
+            results.append(found)
+        self.assertEqual(results[0], results[1], "Sub-pattern results depend on the order of the searches")
+
+    def test_pattern_bundle(self):
+        keys = find_pattern_keys("pedal.mistakes.instructor_append")
+        self.assertIn(("for ___ in ___:\n    __expr__", False), keys)
+        self.assertIn(("sub", "___.append(___)", True, False), keys)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "patterns.pkl")
+            self.assertEqual(save_bundle(path, ["pedal.mistakes.instructor_append"]), len(keys))
+            cache = PatternCache()
+            self.assertEqual(load_bundle(path, cache), len(keys))
+            matcher = cache.get("for ___ in ___:\n    __expr__")
+            self.assertEqual(cache.stats()['misses'], 0, "Bundled pattern was compiled again")
+            self.assertEqual(len(matcher.find_matches("for x in y:\n    z.append(x)")), 1)
+            self.assertEqual(cache.get_sub("___.append(___)").rootNode.ast_name, "Expr")
+
+            patterns = [("x < 5", "if x < 5:\n    pass"), ("x", "y = f(a)\nprint(x)"),
+                        ("_item_ * 0.62", "for item in items:\n    print(item * 0.62)")]
+            matchers = {(pattern, cut): compile_pattern((pattern, cut))
+                        for pattern, student_code in patterns for cut in (False, True)}
+            with open(path, 'wb') as bundle_file:
+                pickle.dump({'stamp': get_grammar_stamp(), 'matchers': matchers}, bundle_file)
+            cache = PatternCache()
+            load_bundle(path, cache)
+            for pattern, student_code in patterns:
+                for cut in (False, True):
+                    bundled = cache.get(pattern, cut).find_matches(student_code, cut=cut)
+                    fresh = StretchyTreeMatcher(pattern).find_matches(student_code, cut=cut)
+                    self.assertEqual(bool(bundled), bool(fresh), "Bundled {!r} matched differently".format(pattern))
+                    self.assertEqual(len(bundled or []), len(fresh or []))
+            self.assertEqual(cache.stats()['misses'], 0)
+
+            with open(path, 'wb') as bundle_file:
+                pickle.dump({'stamp': 'stale', 'matchers': {}}, bundle_file)
+            self.assertEqual(load_bundle(path, PatternCache()), 0)
+
+    def test_associative_chains(self):
+        matcher = StretchyTreeMatcher("x = (_a_ + 1) + 2")
+        self.assertTrue(matcher.find_matches("x = y + (1 + 2)"), "Regrouped chain was not matched")
+        self.assertTrue(matcher.find_matches("x = 2 + y + 1"))
+        self.assertFalse(matcher.find_matches("x = y + (1 + 3)"))
+        self.assertFalse(matcher.find_matches("x = y * (1 * 2)"))
+        match = matcher.find_matches("x = 2 + (1 + total)")[0]
+        self.assertEqual(match.get_std_name("_a_")[0].id, "total")
+
+        size = 12
+        pattern = "x = " + " * ".join("_v{}_".format(index) for index in range(size))
+        student = "x = " + " * ".join("a{}".format(index) for index in reversed(range(size)))
+        matcher = StretchyTreeMatcher(pattern, max_mappings=50)
+        self.assertEqual(len(matcher.find_matches(student)), 1, "Permutations of the same operands were not collapsed")
+        self.assertLess(matcher.mapping_count, size * size * 50)
+
+        matcher = StretchyTreeMatcher("x = _a_ + _b_ + _c_\nprint(_a_)")
+        matches = matcher.find_matches("x = p + q + r\nprint(q)")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0].get_std_name("_a_")[0].id, "q", "A symbol used outside the chain was collapsed")
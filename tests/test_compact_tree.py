@@ -0,0 +1,57 @@
+import unittest
+import ast
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pedal.cait.easy_node import EasyNode
+from pedal.cait.compact_tree import *
+from pedal.cait.stretchy_tree_matching import StretchyTreeMatcher
+from pedal.cait.multi_pattern_matcher import MultiPatternMatcher
+
+
+class CompactTreeTest(unittest.TestCase):
+    def test_same_shape_as_easy_node(self):
+        code = "my_list = [1, 2, 3]\nfor item in my_list:\n    if item == 1:\n        print(item)\nx = 0 < my_list[0] < 5"
+        root = EasyNode(ast.parse(code))
+        compact = root.compact
+        self.assertEqual(len(compact), len(root.linear_tree))
+        for node in root.linear_tree:
+            self.assertIs(node.compact, compact, "Every node of a tree should share its CompactTree")
+            self.assertEqual(TYPE_NAMES[compact.type_codes[node.tree_id]], node.ast_name)
+            self.assertEqual(compact.parents[node.tree_id], -1 if node.parent is None else node.parent.tree_id)
+            self.assertEqual(node.subtree_end, node.tree_id + 1 + sum(child.subtree_end - child.tree_id
+                                                                      for child in node.children))
+            self.assertEqual(node.height, 1 + max([child.height for child in node.children] or [0]))
+        self.assertEqual(compact.count_all(0, "If"), 1)
+        self.assertEqual(compact.count_all(root.children[1].tree_id, "Num"), 1)
+        self.assertTrue(compact.has_name(0, "my_list"))
+        self.assertFalse(compact.has_name(root.children[1].tree_id, "x"))
+
+    def test_type_codes(self):
+        first = EasyNode(ast.parse("x = 0"))
+        second = EasyNode(ast.parse("y = x"))
+        self.assertEqual(first.children[0].type_code, second.children[0].type_code)
+        self.assertNotEqual(first.children[0].children[1].type_code, second.children[0].children[1].type_code)
+        self.assertEqual(get_type_code(ast.Assign), first.children[0].type_code)
+
+    def test_matching(self):
+        code = "total = 0\nfor item in items:\n    total = total + item\nprint(total)"
+        std_ast = StretchyTreeMatcher.as_easy_node(code)
+        matcher = StretchyTreeMatcher("for _item_ in ___:\n    _sum_ = _sum_ + _item_")
+        summary = matcher.summarize(matcher.get_explore_root(True))
+        self.assertTrue(matcher.may_contain_at(summary, std_ast.compact, std_ast.children[1].tree_id))
+        self.assertFalse(matcher.may_contain_at(summary, std_ast.compact, std_ast.children[2].tree_id),
+                         "A subtree without a loop should be ruled out from the arrays")
+        matches = matcher.find_matches(std_ast)
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0].get_std_name("_sum_")[0].id, "total")
+        self.assertEqual(matches[0].match_lineno, 2)
+        patterns = ["print(___)", "_sum_ = _sum_ + _item_", "for ___ in ___:\n    pass"]
+        many = MultiPatternMatcher(patterns).find_matches(std_ast)
+        self.assertEqual([len(matches) for matches in many],
+                         [len(StretchyTreeMatcher(pattern).find_matches(std_ast)) for pattern in patterns])
+
+
+if __name__ == '__main__':
+    unittest.main(buffer=False)
@@ -1,10 +1,12 @@
 import unittest
 import ast
 import sys
+import time
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from pedal.cait.easy_node import *
+from pedal.cait.numeric_logic import CompiledLogic, compile_expression, are_equivalent, numpy
 
 
 class EasyNodeTest(unittest.TestCase):
@@ -28,6 +30,23 @@ class EasyNodeTest(unittest.TestCase):
         with self.subTest():
             no_next_end = third_assign_c.get_next_tree()
             self.assertTrue(no_next_end is None, "next_tree found when it shouldn't be at end")
+        with self.subTest():
+            self.assertTrue(first_assign_c.children[1].next_tree == second_assign_c, "next_tree not found from a leaf")
+
+    def test_is_ancestor(self):
+        program = EasyNode(ast.parse("fun = 0 + 1\nfun01 =  2 + 3"))
+        first_assign = program.children[0]
+        second_assign = program.children[1]
+        bin_op = first_assign.children[1]
+        self.assertTrue(program.is_ancestor(bin_op))
+        self.assertTrue(first_assign.is_ancestor(bin_op))
+        self.assertFalse(second_assign.is_ancestor(bin_op))
+        self.assertFalse(bin_op.is_ancestor(bin_op))
+        self.assertTrue(bin_op.is_descendant(first_assign))
+        self.assertFalse(first_assign.is_descendant(bin_op))
+        self.assertTrue(first_assign.is_before(second_assign))
+        other_program = EasyNode(ast.parse("fun = 0 + 1\nfun01 =  2 + 3"))
+        self.assertFalse(program.is_ancestor(other_program.children[0]))
 
     def test_find_all(self):
         program = ast.parse(
@@ -44,7 +63,14 @@ class EasyNodeTest(unittest.TestCase):
         if0_node = program.children[1]
         if_set_if0 = if0_node.find_all("If")
         self.assertTrue(len(if_set_if0) == 1, "Found {} ifs, when 1 should be found".format(len(if_set_if0)))
-    
+
+        names = for_node.find_all("Name")
+        walked = [node for node in ast.walk(for_node.astNode) if isinstance(node, ast.Name)]
+        self.assertEqual(len(names), len(walked), "Index lookup disagrees with a full traversal")
+        self.assertEqual([name.tree_id for name in names], sorted(name.tree_id for name in names))
+        self.assertTrue(all(for_node.tree_id <= name.tree_id < for_node.subtree_end for name in names))
+        self.assertEqual(program.subtree_end, len(program.linear_tree))
+
     def test_has(self):
         program = ast.parse("x\ny\nx = 0")
         program = EasyNode(program)
@@ -83,6 +109,19 @@ class EasyNodeTest(unittest.TestCase):
                         "Expected ast.cmpop, got {} instead".format(type(binops_funcs[0])))
         self.assertTrue(type(binops_names[0]) == str, "Expected ast.cmpop")
 
+    def test_accessor_caching(self):
+        program = EasyNode(ast.parse("x = [1, 2]\nprint(x)"))
+        assign = program.children[0]
+        self.assertIs(assign.value, assign.children[1])
+        self.assertIn('value', assign.__dict__, "Child accessor was not remembered")
+        body = program.body
+        body.append(None)
+        self.assertEqual(len(program.body), 2, "Cached child lists should not be shared with callers")
+        self.assertIsNone(assign.returns)
+        self.assertIsNone(assign.summary)
+        compare = EasyNode(ast.parse("0 < x <= 1")).children[0].value
+        self.assertEqual(compare.ops_names, ["Lt", "LtE"])
+
     def test_numeric_logic_check(self):
         program = EasyNode(ast.parse("if 24 < x < 35:\n"
                                      "    pass"))
@@ -96,3 +135,31 @@ class EasyNodeTest(unittest.TestCase):
         program = EasyNode(ast.parse("12*2 < x*55 + 36 < 55"))
         compare = program.body[0].value
         self.assertTrue(compare.numeric_logic_check(1, "-12 < x*55 < 55"))
+
+    def test_numeric_logic_check_compiled(self):
+        compare = EasyNode(ast.parse("32 <= temp <= 50")).body[0].value
+        self.assertTrue(compare.numeric_logic_check(1, "temp >= 32 and not temp > 50"))
+        self.assertFalse(compare.numeric_logic_check(1, "32 <= temp <= 60"), "Every comparison in a chain is checked")
+        self.assertFalse(EasyNode(ast.parse("x / 0 > 1")).body[0].value.numeric_logic_check(1, "x > 1"))
+
+        two_variables = EasyNode(ast.parse("x < y and y % 2 == 0")).body[0].value
+        self.assertTrue(two_variables.numeric_logic_check(1, "y > x and not y % 2 != 0"))
+        self.assertFalse(two_variables.numeric_logic_check(1, "x < y", density=3))
+        self.assertTrue(EasyNode(ast.parse("abs(x) < 3")).body[0].value.numeric_logic_check(1, "-3 < x < 3"))
+        self.assertFalse(EasyNode(ast.parse("x")).body[0].value.numeric_logic_check(1, "x > 0"))
+
+        std_logic = CompiledLogic(ast.parse("x * 2 > 7 or x == 0").body[0].value)
+        ins_logic = compile_expression("x > 3.5 or x == 0")
+        self.assertIs(compile_expression("x > 3.5 or x == 0"), ins_logic, "Instructor expressions are compiled once")
+        self.assertTrue(are_equivalent(std_logic, ins_logic, 0.5, density=4, vectorized=False))
+        if numpy is not None:
+            self.assertTrue(are_equivalent(std_logic, ins_logic, 0.5, density=4, vectorized=True))
+
+    def test_numeric_logic_check_many_variables(self):
+        start = time.time()
+        std_logic = CompiledLogic(ast.parse("a + b + c + d > 3 and e - f < g * h").body[0].value)
+        ins_logic = compile_expression("not (d + c + b + a <= 3) and g * h > e - f")
+        self.assertTrue(are_equivalent(std_logic, ins_logic, 1, vectorized=False))
+        wrong_logic = compile_expression("a + b + c + d > 3 and e - f < g * h + 1")
+        self.assertFalse(are_equivalent(std_logic, wrong_logic, 1, vectorized=False))
+        self.assertLess(time.time() - start, 5, "Probing eight variables should be sampled rather than exhaustive")
@@ -17,6 +17,9 @@ class HistogramMistakeTests(MistakeTest):
                        "plt.hist(items)")
         self.assertTrue(histogram_argument_not_list(), "false negative")
 
+        self.to_source("plt.hist(items)")
+        self.assertTrue(histogram_argument_not_list(), "false negative for an undefined argument")
+
     def test_histogram_wrong_list(self):
         self.to_source("for item in items:\n"
                        "    target.append(item)\n"
@@ -6,6 +6,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from pedal.report import *
 from pedal.source import *
+from pedal.source.source_cache import SourceCache
 from execution_helper import Execution
 
 class TestCode(unittest.TestCase):
@@ -36,5 +37,23 @@ class TestCode(unittest.TestCase):
         self.assertEqual(e.label, 'Syntax error')
         self.assertEqual(e.message, "Invalid syntax on line 2")
 
+    def test_source_cache(self):
+        cache = SourceCache(max_size=2)
+        first = cache.parse('a = 0')
+        self.assertIs(cache.parse('a = 0'), first)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        cache.parse('b = 0')
+        cache.parse('c = 0')
+        self.assertNotIn('a = 0', cache)
+        self.assertIsNot(cache.parse('a = 0'), first)
+        self.assertRaises(SyntaxError, cache.parse, 'a b c')
+
+        first_report = Report()
+        set_source('x = 1\nprint(x)', report=first_report)
+        second_report = Report()
+        set_source('x = 1\nprint(x)', report=second_report)
+        self.assertIs(first_report['source']['ast'],
+                      second_report['source']['ast'])
+
 if __name__ == '__main__':
     unittest.main(buffer=False)
\ No newline at end of file
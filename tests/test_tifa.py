@@ -1,12 +1,17 @@
 import unittest
 import os
 import sys
+import copy
+import pickle
 from textwrap import dedent
 from pprint import pprint
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import pedal.tifa
 import pedal.tifa.type_definitions as defs
+from pedal.tifa.state import State
+from pedal.report import Report
+from pedal.source import set_source
 
 unit_tests = {
     # Source Code, Shouldn't catch this, Should catch this
@@ -488,5 +493,103 @@ class TestVariables(unittest.TestCase):
         self.assertFalse(credit.was_type(list))
         self.assertTrue(credit.was_type(int))
 
+    def test_cached_analysis(self):
+        code = 'a = 0\nprint(b)'
+        first_report = Report()
+        set_source(code, report=first_report)
+        pedal.tifa.tifa_analysis(report=first_report)
+        second_report = Report()
+        set_source(code, report=second_report)
+        pedal.tifa.tifa_analysis(report=second_report)
+        self.assertEqual(first_report['tifa']['issues'].keys(),
+                         second_report['tifa']['issues'].keys())
+        self.assertIn('Initialization Problem', second_report['tifa']['issues'])
+        self.assertEqual([f.label for f in first_report.feedback],
+                         [f.label for f in second_report.feedback])
+        self.assertIsNot(first_report['tifa']['issues'],
+                         second_report['tifa']['issues'])
+
+    def test_interned_types(self):
+        self.assertIs(defs.NumType(), defs.NumType())
+        self.assertIs(defs.UnknownType(), defs.UnknownType().clone())
+        self.assertIs(defs.StrType(True), defs.StrType(empty=True))
+        self.assertIsNot(defs.StrType(True), defs.StrType(False))
+        self.assertTrue(defs.StrType(True).is_empty())
+        self.assertFalse(defs.StrType().is_empty())
+        self.assertIs(copy.deepcopy(defs.BoolType()), defs.BoolType())
+        self.assertIs(pickle.loads(pickle.dumps(defs.StrType(True))),
+                      defs.StrType(True))
+        # Compound types can still be changed in place, so they are not shared
+        self.assertIsNot(defs.ListType(), defs.ListType())
+        self.assertIs(defs.StrType(True).clone(), defs.StrType())
+        tifa = pedal.tifa.Tifa()
+        tifa.process_code(dedent('''
+            def f(s):
+                for c in s:
+                    print(c)
+            f("")
+        '''))
+        self.assertNotIn('Iterating over empty list', tifa.report['tifa']['issues'])
+
+    def test_bounded_traces(self):
+        state = State('a', [], defs.ListType(), 'store', None)
+        state = state.copy('load', None)
+        state.type = defs.NumType()
+        for i in range(State.max_trace_depth * 2):
+            state = state.copy('load', None)
+        self.assertLessEqual(state.depth, State.max_trace_depth)
+        # The types from forgotten parts of the trace are still known
+        self.assertTrue(state.was_type('list'))
+        self.assertTrue(state.was_type('num'))
+        self.assertFalse(state.was_type('str'))
+        tifa = pedal.tifa.Tifa()
+        tifa.process_code(dedent('''
+            a = []
+            if a:
+                a = 0
+            else:
+                a = "text"
+            print(a)
+        '''))
+        state = tifa.report['tifa']['top_level_variables']['a']
+        self.assertTrue(state.was_type('list'))
+        self.assertTrue(state.was_type('num'))
+        self.assertTrue(state.was_type('str'))
+        self.assertFalse(state.was_type('bool'))
+
+    def test_function_summaries(self):
+        tifa = pedal.tifa.Tifa()
+        tifa.process_code(dedent('''
+            def label(value):
+                return "total: " + value
+            print(label(1))
+            print(label(2))
+            print(label("a"))
+        '''))
+        summaries = tifa.report['tifa']['function_summaries']
+        self.assertEqual(summaries, {'hits': 1, 'misses': 2})
+        # Calls with the same argument types report their issues again
+        self.assertEqual(len(tifa.report['tifa']['issues']['Incompatible types']), 2)
+        # Calls that change outer variables in place are analyzed every time
+        tifa = pedal.tifa.Tifa()
+        tifa.process_code(dedent('''
+            def make():
+                return []
+            items = []
+            def add(item):
+                items.append(item)
+            add(1)
+            add(2)
+            first = make()
+            first.append(1)
+            second = make()
+            print(items, first, second)
+        '''))
+        self.assertEqual(tifa.report['tifa']['function_summaries'],
+                         {'hits': 1, 'misses': 3})
+        variables = tifa.report['tifa']['top_level_variables']
+        self.assertFalse(variables['first'].type.is_empty())
+        self.assertTrue(variables['second'].type.is_empty())
+
 if __name__ == '__main__':
     unittest.main(buffer=False)
\ No newline at end of file